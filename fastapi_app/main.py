@@ -1,19 +1,111 @@
+import base64
 import logging
+from contextlib import asynccontextmanager
 
+import orjson
 from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 
-from src.extraction.service import process_invoice_bytes
+from src.extraction.extract_invoice import aclose as aclose_docint_client
+from src.extraction.extract_invoice import close as close_docint_session
+from src.extraction.extract_invoice import RateLimitedError
+from src.extraction.service import (
+    process_invoice_batch,
+    process_invoice_bytes_cached_async,
+)
+from src.extraction.tasks import extract_task
+
+MAX_BATCH_FILES = 20
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024   # Azure DI's limit for a single document
+MAX_BATCH_UPLOAD_BYTES = 200 * 1024 * 1024   # whole /extract/batch request body
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(levelname)s:%(name)s:%(message)s",
 )
 
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson: faster than the stdlib encoder and
+    produces bytes directly.
+    """
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+class MaxUploadSizeMiddleware:
+    """
+    Rejects request bodies larger than max_bytes with 413 before they are
+    read (and spooled) by the form parser.
+
+    - path_limits overrides max_bytes for specific paths (e.g. the batch
+      route, whose body carries several documents).
+    - A Content-Length over the limit is refused without reading anything.
+    - Without a Content-Length (chunked uploads), bytes are counted as they
+      arrive and the request is aborted as soon as it crosses the limit.
+    """
+    def __init__(self, app, max_bytes: int, path_limits: dict = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    @staticmethod
+    def _too_large(max_bytes: int) -> HTTPException:
+        return HTTPException(
+            status_code=413,
+            detail=f"Request body too large. Maximum is {max_bytes} bytes.",
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.path_limits.get(scope["path"], self.max_bytes)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit():
+            if int(content_length) > max_bytes:
+                response = ORJSONResponse(
+                    status_code=413, content={"detail": self._too_large(max_bytes).detail}
+                )
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Raised inside request.form(); FastAPI turns it into a 413
+                    raise self._too_large(max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Releases the pooled Azure DI connections when the app shuts down.
+    """
+    yield
+    close_docint_session()
+    await aclose_docint_client()
+
 app = FastAPI(
     title="Invoice Extraction API (FastAPI + Azure Document Intelligence)",
     description="Upload a PDF invoice and get normalized JSON back.",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
+app.add_middleware(
+    MaxUploadSizeMiddleware,
+    max_bytes=MAX_UPLOAD_BYTES,
+    path_limits={"/extract/batch": MAX_BATCH_UPLOAD_BYTES},
 )
 
 @app.get("/health")
@@ -23,6 +115,43 @@ def health_check():
     """
     return {"status": "ok"}
 
+def _upstream_error(e: Exception) -> HTTPException:
+    """
+    Maps a processing error to the HTTP status clients should act on:
+    - RateLimitedError → 429 (with Azure's Retry-After passed through)
+    - TimeoutError     → 504
+    - anything else    → 502
+    """
+    detail = f"Error processing invoice: {e}"
+
+    if isinstance(e, RateLimitedError):
+        headers = {"Retry-After": e.retry_after} if e.retry_after else None
+        return HTTPException(status_code=429, detail=detail, headers=headers)
+
+    if isinstance(e, TimeoutError):
+        return HTTPException(status_code=504, detail=detail)
+
+    return HTTPException(status_code=502, detail=detail)
+
+async def _validate_upload(file: UploadFile) -> None:
+    """
+    HTTP-specific validation shared by the upload endpoints.
+    Leaves the (spooled) upload rewound and ready to be read.
+    """
+    if file.content_type not in ("application/pdf", "application/octet-stream"):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported content type: {file.content_type}. Expected application/pdf.",
+        )
+
+    if not file.size:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+
+    try:
+        await file.seek(0)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read file: {e}") from e
+
 @app.post("/extract")
 async def extract_invoice_endpoint(file: UploadFile = File(...)):
     """
@@ -30,31 +159,121 @@ async def extract_invoice_endpoint(file: UploadFile = File(...)):
     normalizes the result, and returns JSON.
     """
     # 1) HTTP-specific validation
-    if file.content_type not in ("application/pdf", "application/octet-stream"):
+    await _validate_upload(file)
+
+    # 2) Don't read the upload into memory: FastAPI has already spooled it
+    #    (to disk past a small threshold), so we stream it from there.
+
+    # 3) Call shared service logic (async, so waiting on Azure DI doesn't hold a thread)
+    try:
+        normalized, cache_hit = await process_invoice_bytes_cached_async(file.file)
+    except Exception as e:
+        raise _upstream_error(e) from e
+
+    # 4) Return normalized JSON (X-Cache only when result caching is enabled)
+    headers = {}
+    if cache_hit is not None:
+        headers["X-Cache"] = "HIT" if cache_hit else "MISS"
+
+    return ORJSONResponse(content=normalized, headers=headers)
+
+@app.post("/extract/batch")
+async def extract_invoice_batch_endpoint(files: list[UploadFile] = File(...)):
+    """
+    Accepts several PDF uploads (repeated "files" form field), extracts them
+    concurrently with a shared polling loop, and returns one result per file
+    in upload order. A failing invoice does not fail the whole batch.
+
+    The whole request body is capped at MAX_BATCH_UPLOAD_BYTES (413 above it).
+    """
+    if len(files) > MAX_BATCH_FILES:
         raise HTTPException(
             status_code=400,
-            detail=f"Unsupported content type: {file.content_type}. Expected application/pdf.",
+            detail=f"Too many files: {len(files)}. At most {MAX_BATCH_FILES} per batch.",
         )
-    
-    # 2) Read file bytes
+
+    for file in files:
+        await _validate_upload(file)
+
     try:
-        pdf_bytes = await file.read()
+        outcomes = await process_invoice_batch([file.file for file in files])
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to read file: {e}") from e
+        raise HTTPException(
+            status_code=502,
+            detail=f"Error processing invoices: {e}",
+        ) from e
+
+    results = []
+    for file, outcome in zip(files, outcomes):
+        if isinstance(outcome, Exception):
+            results.append({
+                "filename": file.filename,
+                "status": "error",
+                "error": f"Error processing invoice: {outcome}",
+            })
+        else:
+            results.append({"filename": file.filename, "status": "ok", "invoice": outcome})
+
+    return ORJSONResponse(content={"results": results})
+
+def _enqueue_extraction(pdf_bytes: bytes):
+    """
+    Publishes the extraction task. The broker publish is blocking network I/O
+    (and retries for seconds when the broker is down), so callers run this in
+    the threadpool rather than on the event loop.
+    """
+    return extract_task.delay(base64.b64encode(pdf_bytes).decode("ascii"))
+
+@app.post("/extract/jobs", status_code=202)
+async def submit_extraction_job(file: UploadFile = File(...)):
+    """
+    Queues the PDF for background extraction and returns immediately.
+
+    Poll the URL in the Location header (GET /extract/jobs/{job_id})
+    for the normalized JSON.
+    """
+    await _validate_upload(file)
+
+    pdf_bytes = await file.read()
 
-    if not pdf_bytes:
-        raise HTTPException(status_code=400, detail="Uploaded file is empty.")
-    
-    # 3) Call shared service logic
     try:
-        normalized = process_invoice_bytes(pdf_bytes)
+        job = await run_in_threadpool(_enqueue_extraction, pdf_bytes)
     except Exception as e:
-        # In a more advanced design, we might distinguish error types
-        # For now, treat them as upstream/processing errors.
         raise HTTPException(
-            status_code=502,
-            detail=f"Error processing invoice: {e}",
+            status_code=503,
+            detail=f"Failed to queue invoice for extraction: {e}",
         ) from e
 
-    # 4) Return normalized JSON
-    return JSONResponse(content=normalized)
\ No newline at end of file
+    location = f"/extract/jobs/{job.id}"
+    return ORJSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": "queued", "location": location},
+        headers={"Location": location},
+    )
+
+@app.get("/extract/jobs/{job_id}")
+def get_extraction_job(job_id: str):
+    """
+    Returns the normalized JSON once the job has finished.
+
+    - 202 while the job is queued or running
+    - 200 with the normalized invoice on success
+    - 429 / 504 / 502 if the extraction failed (same mapping as /extract)
+    - 404 for an unknown job id, or one whose result has expired
+    """
+    result = extract_task.AsyncResult(job_id)
+
+    # Submitted jobs are marked QUEUED up front, so PENDING means "no record"
+    if result.state == "PENDING":
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+
+    if result.failed():
+        raise _upstream_error(result.result)
+
+    if not result.successful():
+        return ORJSONResponse(
+            status_code=202,
+            content={"job_id": job_id, "status": result.state.lower()},
+        )
+
+    return ORJSONResponse(content=result.result)
@@ -1,19 +1,32 @@
 import datetime as dt
-import json
 import logging
 import os
+import time
+from functools import lru_cache
 
 import azure.functions as func
 import requests
+from requests.adapters import HTTPAdapter
 
-# Keep this in sync with src/extraction/extract_invoice.py
-AZURE_API_VERSION = "2023-07-31"
+from src.extraction.extract_invoice import AZURE_API_VERSION
+from src.extraction.json_output import dump_json, wants_pretty
 
 REQUIRED_ENV_VARS = [
     "DOCINT_ENDPOINT",
     "DOCINT_KEY",
 ]
 
+# Availability tests and probes can hit /api/health every few seconds;
+# reuse the last Document Intelligence result for this long.
+DI_CHECK_TTL_SECONDS = 30
+_last_di_check = {"ts": 0.0, "result": None}
+
+# The probe's own keep-alive session, deliberately without the extraction
+# retry policy: one attempt only, so a probe answers within its timeout and
+# doesn't add load to an Azure DI that is already struggling.
+_PROBE_SESSION = requests.Session()
+_PROBE_SESSION.mount("https://", HTTPAdapter(max_retries=0))
+
 def check_env_vars() -> dict:
     """
     Verify that required environment variables are present.
@@ -31,22 +44,18 @@ def check_env_vars() -> dict:
         "details": details,
     }
 
-def check_document_intelligence() -> dict:
+@lru_cache(maxsize=1)
+def _info_request():
     """
-    Light connectivity check to Azure Document Intelligence.
-
-    Calls the 'info' endpoint, which is cheap and read-only.
-    Does NOT send any documents, so it’s safe to run every few minutes.
+    Builds the 'info' URL and headers once; app settings don't change while
+    the worker runs. A missing setting raises ValueError, which lru_cache
+    does not cache, so fixing the app settings takes effect on the next probe.
     """
     endpoint = os.getenv("DOCINT_ENDPOINT")
     key = os.getenv("DOCINT_KEY")
 
     if not endpoint or not key:
-        return {
-            "name": "document_intelligence",
-            "status": "error",
-            "details": "Missing DOCINT_ENDPOINT or DOCINT_KEY",
-        }
+        raise ValueError("Missing DOCINT_ENDPOINT or DOCINT_KEY")
 
     base_url = endpoint.rstrip("/")
     url = f"{base_url}/formrecognizer/info?api-version={AZURE_API_VERSION}"
@@ -55,8 +64,42 @@ def check_document_intelligence() -> dict:
         "Ocp-Apim-Subscription-Key": key,
     }
 
+    return url, headers
+
+def check_document_intelligence() -> dict:
+    """
+    Light connectivity check to Azure Document Intelligence.
+
+    Calls the 'info' endpoint, which is cheap and read-only.
+    Does NOT send any documents, so it’s safe to run every few minutes.
+
+    The result is cached for DI_CHECK_TTL_SECONDS so back-to-back probes
+    don't each make a round-trip to Azure.
+    """
+    now = time.monotonic()
+    if (
+        _last_di_check["result"] is not None
+        and now - _last_di_check["ts"] < DI_CHECK_TTL_SECONDS
+    ):
+        return _last_di_check["result"]
+
+    result = _check_document_intelligence_uncached()
+    _last_di_check["ts"] = now
+    _last_di_check["result"] = result
+    return result
+
+def _check_document_intelligence_uncached() -> dict:
     try:
-        resp = requests.get(url, headers=headers, timeout=5)
+        url, headers = _info_request()
+    except ValueError as exc:
+        return {
+            "name": "document_intelligence",
+            "status": "error",
+            "details": str(exc),
+        }
+
+    try:
+        resp = _PROBE_SESSION.get(url, headers=headers, timeout=5)
     except Exception as exc:  # network / DNS / SSL, etc.
         logging.exception("Document Intelligence health check failed with exception.")
         return {
@@ -95,6 +138,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     """
     logging.info("Health check request received.")
 
+    pretty = wants_pretty(req.params)
+
     checks = [
         check_env_vars(),
         check_document_intelligence(),
@@ -112,7 +157,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     }
 
     return func.HttpResponse(
-        body=json.dumps(body, indent=2),
+        body=dump_json(body, pretty=pretty),
         status_code=200 if overall_ok else 503,
         mimetype="application/json",
     )
\ No newline at end of file
@@ -1,8 +1,9 @@
 import logging
-import json
 
 import azure.functions as func
 
+from src.extraction.extract_invoice import RateLimitedError
+from src.extraction.json_output import dump_json, wants_pretty
 from src.extraction.service import process_invoice_bytes
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
@@ -15,6 +16,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     """
     logging.info("Invoice Extractor function triggered.")
 
+    pretty = wants_pretty(req.params)
+
     try:
         # 1. Basic input validation
         pdf_bytes = req.get_body()
@@ -24,6 +27,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             return _json_response(
                 {"error": "Request body is empty. Please POST a PDF file."},
                 status_code=400,
+                pretty=pretty,
             )
 
         content_type = req.headers.get("Content-Type", "")
@@ -35,6 +39,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                              "Please send a PDF with Content-Type: application/pdf."
                 },
                 status_code=400,
+                pretty=pretty,
             )
 
         # 2. Call core service logic
@@ -43,12 +48,23 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             normalized = process_invoice_bytes(pdf_bytes)
         except Exception as e:
             logging.error(f"Error during invoice processing: {e}")
+            # 429 / 504 tell clients to back off or retry; 502 for the rest
+            status_code, headers = 502, None
+            if isinstance(e, RateLimitedError):
+                status_code = 429
+                if e.retry_after:
+                    headers = {"Retry-After": e.retry_after}
+            elif isinstance(e, TimeoutError):
+                status_code = 504
+
             return _json_response(
                 {
                     "error": "Failed to process invoice.",
                     "details": str(e),
                 },
-                status_code=502,
+                status_code=status_code,
+                pretty=pretty,
+                headers=headers,
             )
 
         # 3. Success response
@@ -58,7 +74,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             f"total_amount={normalized.get('total_amount')!r}"
         )
 
-        return _json_response(normalized, status_code=200)
+        return _json_response(normalized, status_code=200, pretty=pretty)
 
     except Exception as e:
         # Catch-all safeguard
@@ -66,14 +82,20 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         return _json_response(
             {"error": "Unexpected server error.", "details": str(e)},
             status_code=500,
+            pretty=pretty,
         )
 
-def _json_response(payload: dict, status_code: int = 200) -> func.HttpResponse:
+def _json_response(
+    payload: dict, status_code: int = 200, pretty: bool = False, headers: dict = None
+) -> func.HttpResponse:
     """
     Small helper to return JSON responses consistently.
+
+    Output is compact by default (machine consumers); pretty=True indents it.
     """
     return func.HttpResponse(
-        json.dumps(payload, indent=2),
+        dump_json(payload, pretty=pretty),
         status_code=status_code,
+        headers=headers,
         mimetype="application/json",
     )
\ No newline at end of file
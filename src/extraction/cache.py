@@ -0,0 +1,166 @@
+# src/extraction/cache.py
+
+import dbm
+import hashlib
+import logging
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from functools import partial
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, DbmCache is then single-process only
+    fcntl = None
+
+import orjson
+
+from src.extraction.extract_invoice import AZURE_API_VERSION
+
+logger = logging.getLogger(__name__)
+
+MODEL_ID = "prebuilt-invoice"
+REDIS_TTL_SECONDS = 24 * 60 * 60   # results expire from Redis after a day
+READ_CHUNK_SIZE = 64 * 1024        # chunk size when hashing file objects
+
+def _length_prefixed(part: bytes) -> bytes:
+    """
+    Prefix a key component with its 8-byte length so that different
+    splits of the same concatenated input can never hash the same.
+    """
+    return len(part).to_bytes(8, "big") + part
+
+def new_key_hasher():
+    """
+    Returns a sha256 hasher already seeded with the model id and API version.
+
+    The PDF bytes are fed in last (in one go or chunk by chunk), so a result
+    extracted with another model or API version never matches.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(_length_prefixed(MODEL_ID.encode()))
+    hasher.update(_length_prefixed(AZURE_API_VERSION.encode()))
+    return hasher
+
+def cache_key(pdf_bytes) -> bytes:
+    """
+    Content-addressable key for a PDF: sha256(model || api_version || pdf).
+
+    Accepts raw bytes or a binary file object. A file object is hashed in
+    READ_CHUNK_SIZE chunks and rewound afterwards, so it can still be uploaded.
+    """
+    hasher = new_key_hasher()
+
+    if isinstance(pdf_bytes, (bytes, bytearray, memoryview)):
+        hasher.update(pdf_bytes)
+        return hasher.digest()
+
+    start = pdf_bytes.tell()
+    readinto = getattr(pdf_bytes, "readinto", None)
+
+    if readinto is None:
+        for chunk in iter(partial(pdf_bytes.read, READ_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    else:
+        # Reuse one buffer for the whole file instead of a new bytes per chunk
+        buffer = bytearray(READ_CHUNK_SIZE)
+        view = memoryview(buffer)
+        while True:
+            read = readinto(buffer)
+            if not read:
+                break
+            hasher.update(view[:read])
+
+    pdf_bytes.seek(start)
+
+    return hasher.digest()
+
+def _encode(normalized: dict) -> bytes:
+    return zlib.compress(orjson.dumps(normalized))
+
+def _decode(blob: bytes) -> dict:
+    return orjson.loads(zlib.decompress(blob))
+
+class DbmCache:
+    """
+    Single-host persistent cache backed by the stdlib dbm module.
+
+    The database is opened per operation so that several worker threads
+    and processes (uvicorn, Celery and Functions workers) can share one
+    INVOICE_CACHE_PATH. Each operation holds a thread lock plus an exclusive
+    flock on "<path>.lock": dbm.dumb has no locking of its own and dbm.gnu
+    refuses concurrent opens. Without fcntl (Windows) only the thread lock
+    applies, so use one process per path there, or Redis.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._lock_path = f"{path}.lock"
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path, "a") as lock_file:
+                # Released when the file is closed
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+
+    def get(self, key: bytes):
+        with self._locked(), dbm.open(self.path, "c") as db:
+            blob = db.get(key)
+        return _decode(blob) if blob is not None else None
+
+    def put(self, key: bytes, normalized: dict) -> None:
+        blob = _encode(normalized)
+        with self._locked(), dbm.open(self.path, "c") as db:
+            db[key] = blob
+
+class RedisCache:
+    """
+    Shared cache for multi-process / multi-host deployments.
+    Entries expire after REDIS_TTL_SECONDS.
+    """
+    def __init__(self, url: str, ttl_seconds: int = REDIS_TTL_SECONDS):
+        import redis  # optional dependency, only needed when Redis is configured
+
+        self._client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: bytes):
+        blob = self._client.get(key)
+        return _decode(blob) if blob is not None else None
+
+    def put(self, key: bytes, normalized: dict) -> None:
+        self._client.setex(key, self.ttl_seconds, _encode(normalized))
+
+_cache = None
+_cache_configured = False
+
+def get_cache():
+    """
+    Returns the configured cache backend, or None when caching is disabled.
+
+    Caching is opt-in:
+    - INVOICE_CACHE_REDIS_URL → RedisCache (shared across processes)
+    - INVOICE_CACHE_PATH      → DbmCache (local file)
+    """
+    global _cache, _cache_configured
+
+    if not _cache_configured:
+        redis_url = os.getenv("INVOICE_CACHE_REDIS_URL")
+        dbm_path = os.getenv("INVOICE_CACHE_PATH")
+
+        if redis_url:
+            logger.info("Using Redis invoice cache.")
+            _cache = RedisCache(redis_url)
+        elif dbm_path:
+            logger.info("Using dbm invoice cache at %s", dbm_path)
+            _cache = DbmCache(dbm_path)
+
+        _cache_configured = True
+
+    return _cache
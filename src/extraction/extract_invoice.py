@@ -1,37 +1,168 @@
 # src/extraction/extract_invoice.py
 
+import asyncio
 import os
 import time
-import json
 import logging
+from functools import lru_cache
+import httpx
+import orjson
 import requests
-from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Load environment variables from .env file, in local development only.
+# Deployed hosts inject app settings themselves, so production cold starts
+# skip both the file read and the dotenv import.
+if os.getenv("APP_ENV", "prod") == "dev":
+    from dotenv import load_dotenv
+    load_dotenv()   # <-- This reads DOCINT_ENDPOINT and DOCINT_KEY
 
-# Load environment variables from .env file
-load_dotenv()   # <-- This reads DOCINT_ENDPOINT and DOCINT_KEY
 logger = logging.getLogger(__name__)
 
 AZURE_API_VERSION = "2023-07-31"
 MAX_WAIT_SECONDS = 60         # maximum total polling time
-POLL_INTERVAL = 1             # seconds between polls
+POLL_INITIAL_DELAY = 0.25     # first wait between polls (seconds)
+POLL_BACKOFF_FACTOR = 1.6     # growth factor applied on every further poll
+POLL_MAX_DELAY = 2.0          # upper bound for the computed wait
+SUBMIT_TIMEOUT = (5, 30)      # (connect, read) seconds for the analyze POST
+POLL_TIMEOUT = (5, 10)        # (connect, read) seconds for each poll GET
+UPLOAD_CHUNK_SIZE = 64 * 1024 # chunk size when streaming file objects (async path)
+BATCH_MAX_CONCURRENCY = 8     # max simultaneous analyze POSTs in a batch
+
+# Transient-failure retry policy, shared by the sync and async clients
+MAX_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.3    # waits 0.3s, 0.6s, 1.2s between attempts
+RETRY_AFTER_MAX = 5           # cap (seconds) on a Retry-After honoured for a retry
+# 429 is deliberately not retried here: a rate-limited submit fails fast
+# (RateLimitedError) and a rate-limited poll waits in the polling loop.
+RETRY_STATUSES = (500, 502, 503, 504)
+RATE_LIMIT_DELAY = 2.0        # poll wait after a 429 without Retry-After
 
-def extract_invoice(pdf_bytes: bytes):
+class _RetryPolicy(Retry):
     """
-    Sends invoice PDF bytes to Azure Document Intelligence (prebuilt invoice model)
-    and returns raw JSON result.
-    Now includes:
-    - Timeout
-    - Structured logging
-    - Better error messages
+    urllib3 Retry that only honours Retry-After on RETRY_STATUSES.
+
+    Stock Retry also retries any 413/429 that carries Retry-After (sleeping
+    for it), even though 429 is not in status_forcelist; that would hold the
+    worker instead of failing fast. Used with retry_after_max=RETRY_AFTER_MAX
+    (urllib3's default is 6 hours). Matches _send_async() on the async path.
+    """
+    RETRY_AFTER_STATUS_CODES = frozenset(RETRY_STATUSES)
+
+# One pooled session per process so the analyze POST and every poll GET
+# reuse warm keep-alive connections instead of paying a TLS handshake each time.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=64,
+        max_retries=_RetryPolicy(
+            total=MAX_RETRIES,
+            backoff_factor=RETRY_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=["GET", "POST"],
+            retry_after_max=RETRY_AFTER_MAX,
+            raise_on_status=False,  # hand the last response back to our own checks
+        ),
+    ),
+)
+
+class RateLimitedError(RuntimeError):
+    """
+    Azure DI rejected the document with 429 (Too Many Requests).
+    retry_after carries Azure's Retry-After header value, if any.
+    """
+    def __init__(self, message: str, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Async counterpart for the FastAPI app: one event loop can drive many
+# extractions while they wait on Azure DI, instead of pinning a thread each.
+# Created lazily so it binds to the event loop that actually serves requests.
+_async_client = None
+
+def _get_async_client() -> httpx.AsyncClient:
+    global _async_client
+
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            # The transport retries failed connects; _send_async() retries statuses
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+                retries=MAX_RETRIES,
+            ),
+            timeout=httpx.Timeout(10.0, read=30.0),
+        )
+    return _async_client
+
+def close():
+    """
+    Releases the pooled connections held by the shared session.
+    Call this on application shutdown.
+    """
+    _SESSION.close()
+
+async def aclose():
+    """
+    Async counterpart of close() for the shared httpx client.
+    """
+    global _async_client
+
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def _next_poll_delay(
+    attempt: int, headers, rate_limited: bool = False, remaining: float = None
+) -> float:
+    """
+    How long to wait before the next poll.
+
+    Uses exponential backoff (0.25s, 0.4s, 0.64s, ... capped at POLL_MAX_DELAY),
+    but defers to Azure's Retry-After header when it sends one. After a 429
+    without Retry-After we wait at least RATE_LIMIT_DELAY.
+
+    Retry-After is clamped to at least POLL_INITIAL_DELAY (so "0" or a negative
+    value can't turn the loop into a hot poll), and no wait exceeds `remaining`,
+    the time left before max_wait, so a timeout is noticed on time.
+    """
+    delay = min(POLL_MAX_DELAY, POLL_INITIAL_DELAY * (POLL_BACKOFF_FACTOR ** attempt))
+    if rate_limited:
+        delay = max(delay, RATE_LIMIT_DELAY)
+
+    retry_after = headers.get("Retry-After") if headers else None
+    if retry_after:
+        try:
+            delay = max(float(retry_after), POLL_INITIAL_DELAY)
+        except ValueError:
+            # HTTP-date form is not worth parsing here; keep our own delay
+            logger.debug("Ignoring non-numeric Retry-After: %s", retry_after)
+
+    if remaining is not None:
+        delay = min(delay, max(remaining, 0.0))
+
+    return delay
+
+@lru_cache(maxsize=1)
+def _analyze_request():
     """
+    Builds the analyze URL plus the POST and poll headers from the environment.
 
+    The configuration doesn't change while the process runs, so this is built
+    once and reused by every extraction (a missing variable raises and is not
+    cached). The returned header dicts are shared: copy before changing them.
+    """
     endpoint = os.getenv("DOCINT_ENDPOINT")
     key = os.getenv("DOCINT_KEY")
 
     if not endpoint or not key:
         raise ValueError("Missing DOCINT_ENDPOINT or DOCINT_KEY environment variables.")
-    
-    # 1. Send the PDF to Document Intelligence
+
+    endpoint = endpoint.rstrip("/")
     url = (
         f"{endpoint}/formrecognizer/documentModels/prebuilt-invoice:analyze"
         f"?api-version={AZURE_API_VERSION}"
@@ -41,10 +172,21 @@ def extract_invoice(pdf_bytes: bytes):
         "Ocp-Apim-Subscription-Key": key,
         "Content-Type": "application/pdf"
     }
+    poll_headers = {"Ocp-Apim-Subscription-Key": key}
 
-    logger.info("Sending invoice to Azure DI...")
+    return url, headers, poll_headers
 
-    response = requests.post(url, headers=headers, data=pdf_bytes)
+def _operation_url(response) -> str:
+    """
+    Validates the analyze POST response and returns its Operation-Location URL.
+    """
+    if response.status_code == 429:
+        retry_after = response.headers.get("Retry-After")
+        logger.warning("Azure DI is rate limiting submissions (Retry-After=%s)", retry_after)
+        raise RateLimitedError(
+            "Azure DI rate limit reached (429). Try again later.",
+            retry_after=retry_after,
+        )
 
     if response.status_code != 202:
         logger.error("Azure DI did not accept the document: %s", response.text)
@@ -52,47 +194,318 @@ def extract_invoice(pdf_bytes: bytes):
             f"Azure DI error: {response.status_code}. Expected 202. Body: {response.text}"
         )
 
-    # 2. Get the operation location URL
     operation_url = response.headers["Operation-Location"]
     if not operation_url:
         raise RuntimeError("Azure DI response missing Operation-Location header.")
 
+    return operation_url
+
+def _check_timeout(elapsed: float, max_wait: float = MAX_WAIT_SECONDS) -> None:
+    if elapsed > max_wait:
+        logger.error("Azure DI polling timed out after %s seconds", max_wait)
+        raise TimeoutError(
+            f"Azure Document Intelligence timeout ({max_wait}s)"
+        )
+
+def _finished_result(poll_resp, elapsed: float):
+    """
+    Interprets one poll response.
+
+    Returns the result JSON once Azure DI has succeeded, None while it is
+    still working (or returned an unreadable body), and raises if it failed.
+    """
+    if poll_resp.status_code == 429:
+        logger.warning("Azure DI rate limited polling; backing off.")
+        return None
+
+    # Defensive: Azure sometimes returns empty body during warm-up.
+    # orjson parses the raw bytes directly (no str decode of a large body).
+    try:
+        result_json = orjson.loads(poll_resp.content)
+    except ValueError:
+        logger.warning("Azure DI returned invalid JSON during polling.")
+        return None
+
+    status = result_json.get("status")
+
+    if status == "succeeded":
+        logger.info("Azure DI extraction succeeded in %sms", int(elapsed * 1000))
+        return result_json
+
+    if status == "failed":
+        logger.error("Azure DI reported failure: %s", result_json)
+        raise RuntimeError("Azure DI failed to process the document.")
+
+    # Unknown states: notStarted, running
+    logger.debug("Azure DI status: %s (elapsed=%s)", status, int(elapsed))
+    return None
+
+def extract_invoice(pdf_bytes, *, clock=None, sleep=None, max_wait=None):
+    """
+    Sends invoice PDF bytes to Azure Document Intelligence (prebuilt invoice model)
+    and returns raw JSON result.
+    Now includes:
+    - Timeout
+    - Structured logging
+    - Better error messages
+
+    pdf_bytes may also be a binary file object (e.g. an uploaded, disk-spooled
+    file); requests then streams it to Azure without loading it into memory.
+
+    clock, sleep and max_wait control polling (defaults: time.monotonic,
+    time.sleep, MAX_WAIT_SECONDS); tests pass fakes instead of patching time.
+    """
+    url, headers, poll_headers = _analyze_request()
+
+    # 1. Send the PDF to Document Intelligence
+    logger.info("Sending invoice to Azure DI...")
+
+    # requests sends bytes as-is and streams file objects: no copy of the PDF
+    response = _SESSION.post(
+        url, headers=headers, data=pdf_bytes, timeout=SUBMIT_TIMEOUT
+    )
+
+    # 2. Get the operation location URL
+    operation_url = _operation_url(response)
+
     # 3. Poll for results
     logger.info("Polling Azure DI for result...")
 
-    start_time = time.time()
+    clock = clock or time.monotonic
+    sleep = sleep or time.sleep
+    max_wait = MAX_WAIT_SECONDS if max_wait is None else max_wait
+
+    start_time = clock()
+    attempt = 0
 
     while True:
-        elapsed = time.time() - start_time
+        elapsed = clock() - start_time
+        _check_timeout(elapsed, max_wait)
+
+        # stream=False: read the body in one go; it is parsed straight from bytes
+        poll_resp = _SESSION.get(
+            operation_url, headers=poll_headers, timeout=POLL_TIMEOUT, stream=False
+        )
+
+        result_json = _finished_result(poll_resp, elapsed)
+        if result_json is not None:
+            return result_json
 
-        if elapsed > MAX_WAIT_SECONDS:
-            logger.error("Azure DI polling timed out after %s seconds", MAX_WAIT_SECONDS)
-            raise TimeoutError(
-                f"Azure Document Intelligence timeout ({MAX_WAIT_SECONDS}s)"
+        sleep(
+            _next_poll_delay(
+                attempt,
+                poll_resp.headers,
+                poll_resp.status_code == 429,
+                remaining=max_wait - elapsed,
             )
+        )
+        attempt += 1
 
-        poll_headers = {"Ocp-Apim-Subscription-Key": key}
-        poll_resp = requests.get(operation_url, headers=poll_headers)
+async def _iter_file(pdf_file):
+    """
+    Yields a binary file object in UPLOAD_CHUNK_SIZE chunks without blocking
+    the event loop on disk reads.
+    """
+    while True:
+        chunk = await asyncio.to_thread(pdf_file.read, UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
 
-        # Defensive: Azure sometimes returns empty body during warm-up
-        try:
-            result_json = poll_resp.json()
-        except json.JSONDecodeError:
-            logger.warning("Azure DI returned invalid JSON during polling.")
-            time.sleep(POLL_INTERVAL)
-            continue
+def _async_upload(pdf_bytes, headers: dict):
+    """
+    Returns (content, headers) for an httpx POST of bytes or a file object.
+    """
+    if isinstance(pdf_bytes, (bytes, bytearray, memoryview)):
+        return pdf_bytes, headers
 
-        status = result_json.get("status")
+    # Send a Content-Length so httpx doesn't fall back to chunked encoding
+    start = pdf_bytes.tell()
+    size = pdf_bytes.seek(0, os.SEEK_END) - start
+    pdf_bytes.seek(start)
 
-        if status == "succeeded":
-            duration = int((time.time() - start_time) * 1000)
-            logger.info("Azure DI extraction succeeded in %sms", duration)
+    return _iter_file(pdf_bytes), {**headers, "Content-Length": str(size)}
+
+async def _send_async(
+    client, method: str, url: str, headers: dict, pdf_bytes=None, sleep=None
+):
+    """
+    Sends one request on the async client, retrying RETRY_STATUSES the way
+    urllib3's Retry does for the sync session: exponential backoff, or
+    Retry-After (capped at RETRY_AFTER_MAX) when Azure sends it. The last
+    response is always returned.
+
+    A file-object body is rewound before each attempt so it can be resent.
+    sleep is the coroutine used between attempts (default: asyncio.sleep).
+    """
+    sleep = sleep or asyncio.sleep
+
+    start = None
+    if pdf_bytes is not None and not isinstance(pdf_bytes, (bytes, bytearray, memoryview)):
+        start = pdf_bytes.tell()
+
+    for retry in range(MAX_RETRIES + 1):
+        content, request_headers = None, headers
+        if pdf_bytes is not None:
+            if start is not None:
+                pdf_bytes.seek(start)
+            content, request_headers = _async_upload(pdf_bytes, headers)
+
+        response = await client.request(method, url, headers=request_headers, content=content)
+
+        if response.status_code not in RETRY_STATUSES or retry == MAX_RETRIES:
+            return response
+
+        delay = RETRY_BACKOFF_FACTOR * (2 ** retry)
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                # A huge Retry-After must not hold the worker for minutes
+                delay = min(max(float(retry_after), 0.0), RETRY_AFTER_MAX)
+            except ValueError:
+                pass
+
+        logger.warning(
+            "Azure DI returned %s for %s; retrying in %.2fs", response.status_code, method, delay
+        )
+        await sleep(delay)
+
+async def extract_invoice_async(
+    pdf_bytes, *, clock=None, sleep=None, max_wait=None
+):
+    """
+    Async version of extract_invoice() built on the shared httpx.AsyncClient.
+
+    Accepts the same input (bytes or a seekable binary file object) and
+    options, and returns the same raw JSON result. sleep must be a
+    coroutine function (default: asyncio.sleep); it is also used between
+    retries of a transient Azure DI error.
+    """
+    url, headers, poll_headers = _analyze_request()
+    client = _get_async_client()
+
+    clock = clock or time.monotonic
+    sleep = sleep or asyncio.sleep
+    max_wait = MAX_WAIT_SECONDS if max_wait is None else max_wait
+
+    # 1. Send the PDF to Document Intelligence
+    logger.info("Sending invoice to Azure DI...")
+
+    response = await _send_async(client, "POST", url, headers, pdf_bytes, sleep=sleep)
+
+    # 2. Get the operation location URL
+    operation_url = _operation_url(response)
+
+    # 3. Poll for results
+    logger.info("Polling Azure DI for result...")
+
+    start_time = clock()
+    attempt = 0
+
+    while True:
+        elapsed = clock() - start_time
+        _check_timeout(elapsed, max_wait)
+
+        poll_resp = await _send_async(client, "GET", operation_url, poll_headers, sleep=sleep)
+
+        result_json = _finished_result(poll_resp, elapsed)
+        if result_json is not None:
             return result_json
 
-        if status == "failed":
-            logger.error("Azure DI reported failure: %s", result_json)
-            raise RuntimeError("Azure DI failed to process the document.")
+        await sleep(
+            _next_poll_delay(
+                attempt,
+                poll_resp.headers,
+                poll_resp.status_code == 429,
+                remaining=max_wait - elapsed,
+            )
+        )
+        attempt += 1
+
+async def extract_invoices_async(
+    pdfs: list, *, clock=None, sleep=None, max_wait=None
+) -> list:
+    """
+    Extracts several invoices at once.
+
+    All PDFs are submitted concurrently (at most BATCH_MAX_CONCURRENCY POSTs
+    in flight), then a single loop polls every outstanding operation per tick
+    until each one has finished.
+
+    Returns one entry per input, in order: the raw JSON result, or the
+    exception that document failed with (like gather(return_exceptions=True)).
+    clock, sleep and max_wait behave as in extract_invoice_async().
+    """
+    if not pdfs:
+        return []
+
+    url, headers, poll_headers = _analyze_request()
+    client = _get_async_client()
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    clock = clock or time.monotonic
+    sleep = sleep or asyncio.sleep
+    max_wait = MAX_WAIT_SECONDS if max_wait is None else max_wait
+
+    async def submit(pdf):
+        async with semaphore:
+            response = await _send_async(client, "POST", url, headers, pdf, sleep=sleep)
+        return _operation_url(response)
+
+    # 1. Send every PDF to Document Intelligence
+    logger.info("Sending %s invoices to Azure DI...", len(pdfs))
+
+    results = await asyncio.gather(*(submit(pdf) for pdf in pdfs), return_exceptions=True)
+    pending = {
+        index: operation_url
+        for index, operation_url in enumerate(results)
+        if not isinstance(operation_url, BaseException)
+    }
+
+    # 2. Poll all outstanding operations together
+    logger.info("Polling Azure DI for %s results...", len(pending))
+
+    start_time = clock()
+    attempt = 0
+
+    while pending:
+        elapsed = clock() - start_time
+        try:
+            _check_timeout(elapsed, max_wait)
+        except TimeoutError as e:
+            for index in pending:
+                results[index] = e
+            break
+
+        indices = list(pending)
+        poll_resps = await asyncio.gather(
+            *(
+                _send_async(client, "GET", pending[index], poll_headers, sleep=sleep)
+                for index in indices
+            ),
+            return_exceptions=True,
+        )
+
+        rate_limited = False
+        for index, poll_resp in zip(indices, poll_resps):
+            try:
+                if isinstance(poll_resp, BaseException):
+                    raise poll_resp
+                rate_limited = rate_limited or poll_resp.status_code == 429
+                result_json = _finished_result(poll_resp, elapsed)
+            except Exception as e:
+                results[index] = e
+                del pending[index]
+                continue
+
+            if result_json is not None:
+                results[index] = result_json
+                del pending[index]
+
+        if pending:
+            await sleep(
+                _next_poll_delay(attempt, None, rate_limited, remaining=max_wait - elapsed)
+            )
+            attempt += 1
 
-        # Unknown states: notStarted, running
-        logger.debug("Azure DI status: %s (elapsed=%s)", status, int(elapsed))
-        time.sleep(POLL_INTERVAL)
\ No newline at end of file
+    return results
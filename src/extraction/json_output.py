@@ -0,0 +1,17 @@
+# src/extraction/json_output.py
+
+import orjson
+
+def wants_pretty(params) -> bool:
+    """
+    True when the caller asked for indented JSON with ?pretty=1
+    (also accepts "true" / "yes"). params is the request's query mapping.
+    """
+    return params.get("pretty", "").lower() in ("1", "true", "yes")
+
+def dump_json(payload, pretty: bool = False) -> bytes:
+    """
+    Serializes payload with orjson: compact by default for machine
+    consumers, indented when pretty=True for humans reading it in a browser.
+    """
+    return orjson.dumps(payload, option=orjson.OPT_INDENT_2 if pretty else None)
@@ -1,9 +1,14 @@
-# test_extract_local.py
+# src/extraction/manual_extract_local.py
+
+from dotenv import load_dotenv
 
 from src.extraction.extract_invoice import extract_invoice
 from src.extraction.normalize_output import normalize_invoice
 import json
 
+# Local script: always read DOCINT_ENDPOINT / DOCINT_KEY from .env
+load_dotenv()
+
 with open("samples/example_invoice_1.pdf", "rb") as f:
     pdf_bytes = f.read()
 
@@ -11,6 +11,10 @@ def get_value(field):
     - valueObject
 
     This helper extracts the correct type automatically.
+
+    Kept as plain ordered membership checks, most common keys first: for the
+    handful of keys a field carries this beats a type-table dispatch
+    (no extra .get("type") probe or extractor call per field).
     """
     if not field:
         return None
@@ -29,9 +33,8 @@ def get_value(field):
 
     # Currency → we return just the numeric amount
     if "valueCurrency" in field:
-        currency = field["valueCurrency"]
         # Typically has keys: currencySymbol, amount, currencyCode
-        return currency.get("amount")
+        return field["valueCurrency"].get("amount")
 
     # Arrays
     if "valueArray" in field:
@@ -69,19 +72,21 @@ def normalize_invoice(raw_json: dict) -> dict:
     # ---- Extract items array ----
     items_raw = get_value(fields.get("Items")) or []  # list of valueObject items
 
-    items = []
-    for item in items_raw:
-        obj = get_value(item)  # this is the valueObject dict
-
-        if not obj:
-            continue
-
-        items.append({
-            "description": get_value(obj.get("Description")),
-            "quantity": get_value(obj.get("Quantity")),
-            "unit_price": get_value(obj.get("UnitPrice")),
-            "amount": get_value(obj.get("Amount")),
-        })
+    # Single comprehension with get_value bound locally: this runs once per
+    # line item, so it avoids the per-row global lookups and append calls.
+    # Items without a valueObject are skipped.
+    _gv = get_value
+    items = [
+        {
+            "description": _gv(obj.get("Description")),
+            "quantity": _gv(obj.get("Quantity")),
+            "unit_price": _gv(obj.get("UnitPrice")),
+            "amount": _gv(obj.get("Amount")),
+        }
+        for item in items_raw
+        for obj in (item.get("valueObject"),)
+        if obj
+    ]
 
     # ---- Build final normalized structure ----
     normalized = {
@@ -97,4 +102,4 @@ def normalize_invoice(raw_json: dict) -> dict:
         "confidence": doc.get("confidence")
     }
 
-    return normalized
\ No newline at end of file
+    return normalized
@@ -1,7 +1,56 @@
-from src.extraction.extract_invoice import extract_invoice
+import asyncio
+import logging
+import os
+
+from src.extraction.cache import cache_key, get_cache
+from src.extraction.extract_invoice import (
+    extract_invoice,
+    extract_invoice_async,
+    extract_invoices_async,
+)
 from src.extraction.normalize_output import normalize_invoice
 
-def process_invoice_bytes(pdf_bytes: bytes) -> dict:
+logger = logging.getLogger(__name__)
+
+# Extractions currently running on this event loop, keyed by cache_key().
+# Identical PDFs submitted concurrently share one Azure DI job.
+_INFLIGHT: dict = {}
+
+def _pdf_size(pdf_bytes) -> int:
+    """
+    Number of bytes left to read, for raw bytes or a seekable file object.
+    """
+    if isinstance(pdf_bytes, (bytes, bytearray, memoryview)):
+        return len(pdf_bytes)
+
+    start = pdf_bytes.tell()
+    end = pdf_bytes.seek(0, os.SEEK_END)
+    pdf_bytes.seek(start)
+    return end - start
+
+def _cache_get(cache, key: bytes):
+    """
+    cache.get(), except that a failing cache (Redis down, dbm open error)
+    is logged and treated as a miss: the cache is an optimization, Azure DI
+    is still the source of truth.
+    """
+    try:
+        return cache.get(key)
+    except Exception:
+        logger.warning("Invoice cache lookup failed; treating it as a miss.", exc_info=True)
+        return None
+
+def _cache_put(cache, key: bytes, normalized: dict) -> None:
+    """
+    cache.put(), except that a failure is logged and the result simply
+    isn't stored.
+    """
+    try:
+        cache.put(key, normalized)
+    except Exception:
+        logger.warning("Invoice cache store failed; result not cached.", exc_info=True)
+
+def process_invoice_bytes(pdf_bytes) -> dict:
     """
     Core business logic:
     - Takes raw PDF bytes
@@ -9,16 +58,140 @@ def process_invoice_bytes(pdf_bytes: bytes) -> dict:
     - Normalizes the result
     - Returns the normalized JSON dict
 
+    pdf_bytes may also be a seekable binary file object; it is then
+    streamed to Azure instead of being read into memory.
+
     This function does NOT know anything about HTTP, status codes,
     request headers, or frameworks.
     """
-    if not pdf_bytes:
+    normalized, _cache_hit = process_invoice_bytes_cached(pdf_bytes)
+    return normalized
+
+def process_invoice_bytes_cached(pdf_bytes) -> tuple:
+    """
+    Same as process_invoice_bytes(), but also reports the cache outcome.
+
+    Returns (normalized, cache_hit) where cache_hit is:
+    - True  → served from the cache, Azure DI was not called
+    - False → cache miss (or cache unavailable), the result was stored if possible
+    - None  → caching is disabled
+    """
+    if _pdf_size(pdf_bytes) == 0:
         raise ValueError("PDF bytes are empty.")
 
+    cache = get_cache()
+    key = None
+
+    if cache is not None:
+        key = cache_key(pdf_bytes)
+        cached = _cache_get(cache, key)
+        if cached is not None:
+            return cached, True
+
     # 1) Call Azure Document Intelligence
     raw_result = extract_invoice(pdf_bytes)
 
     # 2) Normalize
     normalized = normalize_invoice(raw_result)
 
-    return normalized
\ No newline at end of file
+    if cache is None:
+        return normalized, None
+
+    _cache_put(cache, key, normalized)
+    return normalized, False
+
+async def process_invoice_bytes_cached_async(pdf_bytes) -> tuple:
+    """
+    Async version of process_invoice_bytes_cached() for the FastAPI app.
+
+    Azure DI is called through the shared httpx.AsyncClient; cache lookups
+    and hashing run in a worker thread so they don't block the event loop.
+
+    Concurrent calls for the same PDF are coalesced: the first one does the
+    work, the others await its result instead of submitting their own job.
+    """
+    if _pdf_size(pdf_bytes) == 0:
+        raise ValueError("PDF bytes are empty.")
+
+    key = await asyncio.to_thread(cache_key, pdf_bytes)
+
+    task = _INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_process_invoice_async(pdf_bytes, key))
+        _INFLIGHT[key] = task
+
+        def _forget(done_task, key=key):
+            if _INFLIGHT.get(key) is done_task:
+                del _INFLIGHT[key]
+
+        task.add_done_callback(_forget)
+    else:
+        logger.info("Joining in-flight extraction for an identical PDF.")
+
+    # shield: one caller going away must not cancel the job for the others
+    return await asyncio.shield(task)
+
+async def _process_invoice_async(pdf_bytes, key: bytes) -> tuple:
+    cache = get_cache()
+
+    if cache is not None:
+        cached = await asyncio.to_thread(_cache_get, cache, key)
+        if cached is not None:
+            return cached, True
+
+    # 1) Call Azure Document Intelligence
+    raw_result = await extract_invoice_async(pdf_bytes)
+
+    # 2) Normalize
+    normalized = normalize_invoice(raw_result)
+
+    if cache is None:
+        return normalized, None
+
+    await asyncio.to_thread(_cache_put, cache, key, normalized)
+    return normalized, False
+
+async def process_invoice_batch(pdfs: list) -> list:
+    """
+    Batch version of process_invoice_bytes_cached_async().
+
+    Cache hits are served directly; all misses go to Azure DI together
+    through extract_invoices_async(), sharing one polling loop.
+
+    Returns one entry per input, in order: the normalized dict, or the
+    exception that document failed with.
+    """
+    if any(_pdf_size(pdf) == 0 for pdf in pdfs):
+        raise ValueError("PDF bytes are empty.")
+
+    cache = get_cache()
+    results = [None] * len(pdfs)
+    keys = [None] * len(pdfs)
+
+    if cache is not None:
+        for index, pdf in enumerate(pdfs):
+            keys[index] = await asyncio.to_thread(cache_key, pdf)
+            results[index] = await asyncio.to_thread(_cache_get, cache, keys[index])
+
+    misses = [index for index, cached in enumerate(results) if cached is None]
+
+    # 1) Call Azure Document Intelligence for everything not cached
+    raw_results = await extract_invoices_async([pdfs[index] for index in misses])
+
+    # 2) Normalize
+    for index, raw_result in zip(misses, raw_results):
+        if isinstance(raw_result, Exception):
+            results[index] = raw_result
+            continue
+
+        try:
+            normalized = normalize_invoice(raw_result)
+        except Exception as e:
+            results[index] = e
+            continue
+
+        results[index] = normalized
+        if cache is not None:
+            await asyncio.to_thread(_cache_put, cache, keys[index], normalized)
+
+    return results
@@ -0,0 +1,49 @@
+# src/extraction/tasks.py
+
+import base64
+import os
+
+from celery import Celery
+from celery.signals import before_task_publish
+
+from src.extraction.service import process_invoice_bytes
+
+QUEUED_STATE = "QUEUED"
+
+BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", BROKER_URL)
+
+celery_app = Celery(
+    "invoice_extraction",
+    broker=BROKER_URL,
+    backend=RESULT_BACKEND,
+)
+celery_app.conf.update(
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    task_track_started=True,
+    result_expires=24 * 60 * 60,   # results are fetched once; don't keep them forever
+)
+
+@celery_app.task(name="invoice_extraction.extract")
+def extract_task(pdf_b64: str) -> dict:
+    """
+    Background job: runs the normal extraction pipeline on a worker.
+
+    The PDF travels through the broker base64-encoded (JSON serializer),
+    and the normalized dict is stored in the result backend.
+    """
+    return process_invoice_bytes(base64.b64decode(pdf_b64))
+
+@before_task_publish.connect(sender=extract_task.name)
+def _mark_job_queued(headers=None, **kwargs):
+    """
+    Records the job in the result backend before it is published.
+
+    Celery reports any id it has no record of as PENDING, so without this
+    a mistyped or expired job id would look queued forever. Stored before
+    publishing, the marker can't overwrite a result from a fast worker, and
+    it expires with the results (result_expires).
+    """
+    celery_app.backend.store_result(headers["id"], None, QUEUED_STATE)
@@ -0,0 +1,18 @@
+# tests/_helpers.py
+
+import orjson
+
+def _canonical(obj) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+
+def assert_json_equal(actual, expected) -> None:
+    """
+    Assert two JSON-like values are equal.
+
+    Both sides are serialized with sorted keys and compared as bytes. Only
+    on a mismatch do we fall back to `==`, which still passes for values
+    that differ only in representation (e.g. 1 vs 1.0) and otherwise gives
+    pytest's readable diff.
+    """
+    if _canonical(actual) != _canonical(expected):
+        assert actual == expected
@@ -0,0 +1,23 @@
+# tests/_sample_cache.py
+
+import mmap
+from functools import lru_cache
+
+import orjson
+
+
+@lru_cache(maxsize=None)
+def load(path: str) -> dict:
+    """
+    Parse a sample JSON file once per process and return the cached dict.
+
+    The file is memory-mapped and parsed by orjson straight from the
+    mapping, without reading it into an intermediate bytes object first.
+
+    Callers share the returned object; wrap it in copy.deepcopy() if a
+    test needs to mutate it.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with memoryview(mm) as view:
+            return orjson.loads(view)
+
@@ -1,9 +1,31 @@
 import sys
 from pathlib import Path
 
+import pytest
+
 # Get the project root directory (one level above tests/)
 ROOT_DIR = Path(__file__).resolve().parents[1]
 
 # Add the root directory to sys.path so "import src" works
 if str(ROOT_DIR) not in sys.path:
-    sys.path.insert(0, str(ROOT_DIR))
\ No newline at end of file
+    sys.path.insert(0, str(ROOT_DIR))
+
+from tests._sample_cache import load  # noqa: E402  (needs ROOT_DIR on sys.path)
+
+# ---- Shared sample fixtures ----
+# Parsing is cached per process in tests/_sample_cache.py. Nothing under
+# test mutates these dicts, so tests share them.
+
+@pytest.fixture(scope="session")
+def samples_root() -> Path:
+    return ROOT_DIR / "samples"
+
+@pytest.fixture(scope="session")
+def raw_sample(samples_root) -> dict:
+    """Raw Azure DI output (samples/raw_output_example.json)."""
+    return load(str(samples_root / "raw_output_example.json"))
+
+@pytest.fixture(scope="session")
+def expected_normalized(samples_root) -> dict:
+    """Expected normalize_invoice() output (samples/normalized_output_example.json)."""
+    return load(str(samples_root / "normalized_output_example.json"))
@@ -1,10 +1,14 @@
 # tests/test_api_fastapi.py
 
+import asyncio
+import base64
+
 from fastapi.testclient import TestClient
 
 from fastapi_app.main import app
 import fastapi_app.main as main
 from src.extraction import service
+from src.extraction.extract_invoice import RateLimitedError
 
 client = TestClient(app)
 
@@ -24,20 +28,14 @@ def test_extract_endpoint_happy_path(monkeypatch):
         "items": [],
     }
 
-    # 2) Define fake process_invoice_bytes
-    def fake_process(pdf_bytes: bytes) -> dict:
-        # Check that we received some bytes from the upload
-        assert isinstance(pdf_bytes, (bytes, bytearray))
-        assert len(pdf_bytes) > 0
-        return fake_normalized
+    # 2) Define fake process_invoice_bytes_cached_async (caching disabled → None)
+    async def fake_process(pdf_file):
+        # The upload is handed over as a file object, not read into memory
+        assert pdf_file.read() == b"%PDF-1.4 fake content"
+        return fake_normalized, None
     
     # 3) Monkeypatch the real function with our fake one
-    monkeypatch.setattr(
-        main,
-        "process_invoice_bytes",
-        fake_process,
-        raising=True,
-    )
+    monkeypatch.setattr(main, "process_invoice_bytes_cached_async", fake_process)
 
     # 4) Build a fake "file upload" for TestClient
     files = {
@@ -50,6 +48,26 @@ def test_extract_endpoint_happy_path(monkeypatch):
     # 6) Assert everything is correct
     assert response.status_code == 200
     assert response.json() == fake_normalized
+    assert "X-Cache" not in response.headers
+
+def test_extract_endpoint_reports_cache_hit(monkeypatch):
+    """
+    When the service reports a cache hit, the endpoint exposes it
+    via the X-Cache response header.
+    """
+    async def fake_process(pdf_bytes: bytes):
+        return {"invoice_id": "INV-123"}, True
+
+    monkeypatch.setattr(main, "process_invoice_bytes_cached_async", fake_process)
+
+    files = {
+        "file": ("invoice.pdf", b"%PDF-1.4 fake content", "application/pdf")
+    }
+
+    response = client.post("/extract", files=files)
+
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "HIT"
 
 def test_extract_endpoint_rejects_non_pdf():
     """
@@ -93,11 +111,11 @@ def test_extract_endpoint_service_error_returns_502(monkeypatch):
     If process_invoice_bytes raises an exception, the endpoint should
     catch it and return a 502 with the appropriate error message.
     """
-    def fake_process(pdf_bytes: bytes):
+    async def fake_process(pdf_bytes: bytes):
         raise RuntimeError("Something went wrong in service layer")
 
     # Patch the function imported in main.py
-    monkeypatch.setattr(main, "process_invoice_bytes", fake_process, raising=True)
+    monkeypatch.setattr(main, "process_invoice_bytes_cached_async", fake_process)
 
     files = {
         "file": ("invoice.pdf", b"%PDF-1.4 content", "application/pdf")
@@ -116,4 +134,197 @@ def test_health_check():
     response = client.get("/health")
 
     assert response.status_code == 200
-    assert response.json() == {"status": "ok"}
\ No newline at end of file
+    assert response.json() == {"status": "ok"}
+
+class FakeAsyncResult:
+    """
+    Just enough of celery.result.AsyncResult for the job-status endpoint.
+    """
+    def __init__(self, state, result=None, id="job-123"):
+        self.id = id
+        self.state = state
+        self.result = result
+
+    def failed(self):
+        return self.state == "FAILURE"
+
+    def successful(self):
+        return self.state == "SUCCESS"
+
+class FakeExtractTask:
+    """
+    Stands in for the Celery task so no broker is needed.
+    """
+    def __init__(self, async_result=None):
+        self.sent = []
+        self.on_event_loop = []
+        self.async_result = async_result
+
+    def delay(self, pdf_b64):
+        self.sent.append(pdf_b64)
+        try:
+            asyncio.get_running_loop()
+            self.on_event_loop.append(True)
+        except RuntimeError:
+            self.on_event_loop.append(False)
+        return FakeAsyncResult("PENDING")
+
+    def AsyncResult(self, job_id):
+        return self.async_result
+
+def test_submit_extraction_job_returns_202_with_location(monkeypatch):
+    """
+    POST /extract/jobs queues the base64-encoded PDF and returns 202
+    with a Location pointing at the job-status endpoint.
+    """
+    task = FakeExtractTask()
+    monkeypatch.setattr(main, "extract_task", task)
+
+    files = {
+        "file": ("invoice.pdf", b"%PDF-1.4 content", "application/pdf")
+    }
+
+    response = client.post("/extract/jobs", files=files)
+
+    assert response.status_code == 202
+    assert response.headers["Location"] == "/extract/jobs/job-123"
+    assert response.json()["job_id"] == "job-123"
+    assert base64.b64decode(task.sent[0]) == b"%PDF-1.4 content"
+    # The blocking broker publish must run in the threadpool, not on the loop
+    assert task.on_event_loop == [False]
+
+def test_get_extraction_job_states(monkeypatch):
+    """
+    GET /extract/jobs/{id} returns 202 while running, 200 with the
+    normalized JSON on success, maps failures like /extract does, and
+    404s for ids Celery has no record of (PENDING).
+    """
+    cases = [
+        (FakeAsyncResult("PENDING"), 404),
+        (FakeAsyncResult("QUEUED"), 202),
+        (FakeAsyncResult("STARTED"), 202),
+        (FakeAsyncResult("SUCCESS", {"invoice_id": "INV-123"}), 200),
+        (FakeAsyncResult("FAILURE", TimeoutError("Azure DI timeout")), 504),
+        (FakeAsyncResult("FAILURE", RateLimitedError("Rate limited", retry_after="7")), 429),
+        (FakeAsyncResult("FAILURE", RuntimeError("Azure DI failed")), 502),
+    ]
+
+    responses = {}
+    for async_result, expected_status in cases:
+        monkeypatch.setattr(main, "extract_task", FakeExtractTask(async_result))
+
+        response = client.get("/extract/jobs/job-123")
+
+        assert response.status_code == expected_status
+        responses[expected_status] = response
+
+    assert responses[429].headers["Retry-After"] == "7"
+    assert responses[502].json()["detail"] == "Error processing invoice: Azure DI failed"
+
+def test_extract_batch_reports_per_file_results(monkeypatch):
+    """
+    POST /extract/batch returns one entry per uploaded file, in order;
+    a failing invoice is reported without failing the whole batch.
+    """
+    async def fake_batch(pdf_files):
+        assert [f.read() for f in pdf_files] == [b"%PDF-1.4 one", b"%PDF-1.4 two"]
+        return [{"invoice_id": "INV-1"}, RuntimeError("Azure DI failed")]
+
+    monkeypatch.setattr(main, "process_invoice_batch", fake_batch)
+
+    files = [
+        ("files", ("one.pdf", b"%PDF-1.4 one", "application/pdf")),
+        ("files", ("two.pdf", b"%PDF-1.4 two", "application/pdf")),
+    ]
+
+    response = client.post("/extract/batch", files=files)
+
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"filename": "one.pdf", "status": "ok", "invoice": {"invoice_id": "INV-1"}},
+        {
+            "filename": "two.pdf",
+            "status": "error",
+            "error": "Error processing invoice: Azure DI failed",
+        },
+    ]
+
+def test_extract_endpoint_rejects_oversized_upload(monkeypatch):
+    """
+    Uploads over the size limit get a 413, whether the size is declared
+    up front in Content-Length or only discovered while streaming.
+    """
+    async def fake_process(pdf_file):
+        raise AssertionError("oversized uploads must not reach the service")
+
+    monkeypatch.setattr(main, "process_invoice_bytes_cached_async", fake_process)
+
+    # Same app behind a much smaller limit
+    small_client = TestClient(main.MaxUploadSizeMiddleware(app, max_bytes=1024))
+
+    files = {
+        "file": ("big.pdf", b"%PDF-1.4 " + b"x" * 2048, "application/pdf")
+    }
+
+    response = small_client.post("/extract", files=files)
+    assert response.status_code == 413
+
+    def chunks():
+        yield b"x" * 1000
+        yield b"x" * 1000
+
+    response = small_client.post(
+        "/extract",
+        content=chunks(),
+        headers={"Content-Type": "multipart/form-data; boundary=abc"},
+    )
+    assert response.status_code == 413
+
+def test_extract_batch_has_its_own_size_limit(monkeypatch):
+    """
+    /extract/batch is capped by its path limit rather than the
+    single-document one; other routes keep the default.
+    """
+    async def fake_batch(pdf_files):
+        return [{"invoice_id": "INV-1"}, {"invoice_id": "INV-2"}]
+
+    monkeypatch.setattr(main, "process_invoice_batch", fake_batch)
+
+    small_client = TestClient(
+        main.MaxUploadSizeMiddleware(
+            app, max_bytes=1024, path_limits={"/extract/batch": 4096}
+        )
+    )
+
+    files = [
+        ("files", ("one.pdf", b"%PDF-1.4 " + b"x" * 800, "application/pdf")),
+        ("files", ("two.pdf", b"%PDF-1.4 " + b"x" * 800, "application/pdf")),
+    ]
+
+    assert small_client.post("/extract/batch", files=files).status_code == 200
+    assert small_client.post("/extract", files=files).status_code == 413
+
+def test_extract_endpoint_maps_timeout_and_rate_limit(monkeypatch):
+    """
+    An Azure DI timeout becomes 504; a rate-limited submit becomes 429
+    with Azure's Retry-After passed through.
+    """
+    errors = [
+        (TimeoutError("Azure Document Intelligence timeout (60s)"), 504),
+        (RateLimitedError("Azure DI rate limit reached (429).", retry_after="7"), 429),
+    ]
+    files = {
+        "file": ("invoice.pdf", b"%PDF-1.4 content", "application/pdf")
+    }
+
+    for error, expected_status in errors:
+        async def fake_process(pdf_file, error=error):
+            raise error
+
+        monkeypatch.setattr(main, "process_invoice_bytes_cached_async", fake_process)
+
+        response = client.post("/extract", files=files)
+
+        assert response.status_code == expected_status
+
+    assert response.headers["Retry-After"] == "7"
@@ -0,0 +1,83 @@
+# tests/test_cache.py
+
+import io
+import multiprocessing
+
+import pytest
+
+from src.extraction import cache
+
+def test_cache_key_is_stable_and_content_addressed():
+    """
+    Same bytes → same key; different bytes → different key.
+    Hashing chunk by chunk must give the same key as hashing in one go.
+    """
+    key = cache.cache_key(b"%PDF-1.4 invoice")
+
+    assert key == cache.cache_key(b"%PDF-1.4 invoice")
+    assert key != cache.cache_key(b"%PDF-1.4 other invoice")
+
+    hasher = cache.new_key_hasher()
+    hasher.update(b"%PDF-1.4 ")
+    hasher.update(b"invoice")
+    assert hasher.digest() == key
+
+def test_cache_key_streams_file_objects():
+    """
+    A file object hashes to the same key as its bytes and is rewound
+    afterwards, so it can still be uploaded.
+    """
+    pdf_file = io.BytesIO(b"%PDF-1.4 invoice")
+
+    assert cache.cache_key(pdf_file) == cache.cache_key(b"%PDF-1.4 invoice")
+    assert pdf_file.tell() == 0
+
+def test_cache_key_depends_on_api_version(monkeypatch):
+    """
+    A result extracted with another API version must not be reused.
+    """
+    key = cache.cache_key(b"%PDF-1.4 invoice")
+
+    monkeypatch.setattr(cache, "AZURE_API_VERSION", "2024-11-30")
+
+    assert cache.cache_key(b"%PDF-1.4 invoice") != key
+
+def test_dbm_cache_round_trip(tmp_path):
+    """
+    DbmCache returns None on a miss and the stored dict on a hit.
+    """
+    store = cache.DbmCache(str(tmp_path / "invoice-cache"))
+    key = cache.cache_key(b"%PDF-1.4 invoice")
+    normalized = {"invoice_id": "INV-100", "items": [{"amount": 60.0}]}
+
+    assert store.get(key) is None
+
+    store.put(key, normalized)
+
+    assert store.get(key) == normalized
+
+def _put_many(path: str, worker: int) -> None:
+    store = cache.DbmCache(path)
+    for i in range(25):
+        store.put(cache.cache_key(f"{worker}-{i}".encode()), {"worker": worker, "i": i})
+
+@pytest.mark.skipif(cache.fcntl is None, reason="cross-process lock needs fcntl")
+def test_dbm_cache_is_shared_safely_across_processes(tmp_path):
+    """
+    Several worker processes writing the same INVOICE_CACHE_PATH don't
+    lose or corrupt each other's entries (writes are serialized by flock).
+    """
+    path = str(tmp_path / "invoice-cache")
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_put_many, args=(path, worker)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+    assert all(process.exitcode == 0 for process in workers)
+
+    store = cache.DbmCache(path)
+    for worker in range(4):
+        for i in range(25):
+            assert store.get(cache.cache_key(f"{worker}-{i}".encode())) == {"worker": worker, "i": i}
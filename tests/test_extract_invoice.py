@@ -1,232 +1,381 @@
 # tests/test_extract_invoice.py
 
+import asyncio
+import contextlib
+import io
+import re
+from types import SimpleNamespace
+
+import httpx
+import orjson
 import pytest
+import responses
 
 from src.extraction import extract_invoice as ei
 
-class FakePostResponse:
+@pytest.fixture(autouse=True)
+def _fresh_analyze_request():
     """
-    Fake object that looks enough like requests.Response for the POST call.
-    We only implement the attributes extract_invoice() actually uses:
-    - status_code
-    - headers
-    - text
+    The analyze URL/headers are cached per process; rebuild them from each
+    test's environment.
     """
-    def __init__(self, status_code=202, headers=None, text=""):
-        self.status_code = status_code
-        self.headers = headers or {}
-        self.text = text
+    ei._analyze_request.cache_clear()
+    yield
+    ei._analyze_request.cache_clear()
 
-class FakeGetResponse:
+@pytest.fixture(autouse=True)
+def _docint_env(monkeypatch):
+    """Fake Azure DI configuration for every test in this module."""
+    monkeypatch.setenv(
+        "DOCINT_ENDPOINT",
+        "https://fake-resource.cognitiveservices.azure.com",
+    )
+    monkeypatch.setenv("DOCINT_KEY", "fake-key")
+
+@pytest.fixture(autouse=True)
+def _no_sleep(monkeypatch):
     """
-    Fake object that looks enough like requests.Response for the GET call.
-    We only implement .json(), since that's what extract_invoice() uses.
+    Polling never waits for real in this module: extract_invoice() looks up
+    time.sleep at call time, so tests that don't inject their own sleep get
+    this no-op.
     """
-    def __init__(self, payload):
-        self._payload = payload
+    monkeypatch.setattr(ei.time, "sleep", lambda _s: None)
 
-    def json(self):
-        return self._payload
+OP_URL = "https://fake-op-url/analyzeResults/1"
+ANALYZE_URL = re.compile(
+    r"https://fake-resource\.cognitiveservices\.azure\.com/.*prebuilt-invoice:analyze"
+)
 
-def test_extract_invoice_success(monkeypatch):
+# Canned poll bodies, serialized once at import time and shared by every
+# test and poll.
+SUCCEEDED_PAYLOAD = {"status": "succeeded", "analyzeResult": {"documents": []}}
+SUCCEEDED_BODY = orjson.dumps(SUCCEEDED_PAYLOAD)
+RUNNING_BODY = orjson.dumps({"status": "running"})
+FAILED_BODY = orjson.dumps(
+    {"status": "failed", "error": {"code": "SomeError", "message": "Processing failed"}}
+)
+
+PDF_BYTES = b"dummy-pdf"
+
+def _add_analyze(status=202, body="", headers=None):
     """
-    Scenario:
-    - Env vars are set.
-    - POST returns 202 + Operation-Location header.
-    - GET to Operation-Location returns status='succeeded' with analyzeResult.
-    Expectation:
-    - extract_invoice() returns that JSON dict.
+    Registers the analyze POST: answers with `status`
+    (and an Operation-Location header on 202).
     """
+    if headers is None:
+        headers = {"Operation-Location": OP_URL} if status == 202 else {}
+    responses.add(responses.POST, ANALYZE_URL, status=status, body=body, headers=headers)
 
-    # 1) Set fake environment variables
-    # DOCINT_ENDPOINT is the base URL your code uses.
-    monkeypatch.setenv(
-        "DOCINT_ENDPOINT",
-        "https://fake-resource.cognitiveservices.azure.com",
+def _assert_requests_shape():
+    """
+    Checks what extract_invoice() sent to Azure DI on every recorded call.
+    """
+    submit = responses.calls[0].request
+
+    # Header checks
+    assert submit.headers["Ocp-Apim-Subscription-Key"] == "fake-key"
+    assert submit.headers["Content-Type"] == "application/pdf"
+
+    # Body check: the caller's bytes object is passed through, not copied
+    assert submit.body is PDF_BYTES
+
+    for call in responses.calls[1:]:
+        # Ensure the correct URL and headers are used for polling
+        assert call.request.url == OP_URL
+        assert call.request.headers["Ocp-Apim-Subscription-Key"] == "fake-key"
+
+# (id, POST status, POST body, poll body, expected exception, message match)
+CASES = [
+    # GET to Operation-Location returns status='succeeded' with analyzeResult
+    ("success", 202, "", SUCCEEDED_BODY, None, None),
+    # POST returns a non-202 status code (e.g. 400 Bad Request)
+    ("non202", 400, "Bad request", None, RuntimeError, "Azure DI error: 400.*Bad request"),
+    # Azure keeps returning status='running' until the fake clock passes max_wait
+    ("timeout", 202, "", RUNNING_BODY, TimeoutError, "(?i)timeout"),
+    # Azure reports status='failed'
+    ("failed", 202, "", FAILED_BODY, RuntimeError, "failed to process"),
+]
+
+@pytest.mark.parametrize(
+    "post_status, post_text, get_body, expected_exception, match",
+    [case[1:] for case in CASES],
+    ids=[case[0] for case in CASES],
+)
+@responses.activate
+def test_extract_invoice(post_status, post_text, get_body, expected_exception, match):
+    """
+    Runs extract_invoice() against a fake Azure DI (the responses library
+    intercepts the shared session's HTTP calls):
+    - POST answers with post_status (+ Operation-Location on 202).
+    - Every poll answers with get_body.
+    Expectation:
+    - the succeeded JSON is returned, or expected_exception is raised.
+
+    The fake clock starts at 0.0, reads 0.5 on the first poll and 2.0 on the
+    second, so with max_wait=1 a job still running after one poll times out
+    (sleeping in between is a no-op via _no_sleep).
+    """
+    _add_analyze(post_status, body=post_text)
+    if get_body is not None:
+        responses.add(responses.GET, OP_URL, body=get_body)
+
+    fake_clock = iter([0.0, 0.5, 2.0]).__next__
+    expectation = (
+        pytest.raises(expected_exception, match=match)
+        if expected_exception
+        else contextlib.nullcontext()
     )
-    monkeypatch.setenv("DOCINT_KEY", "fake-key")
 
-    # 2) Define fake POST to simulate Azure accepting the document
-    def fake_post(url, headers, data):
-        # We can assert basic correctness of the request:
-        assert url.startswith("https://fake-resource.cognitiveservices.azure.com")
-        assert "prebuilt-invoice:analyze" in url
+    with expectation:
+        result = ei.extract_invoice(PDF_BYTES, clock=fake_clock, max_wait=1)
+
+    _assert_requests_shape()
+    if expected_exception is None:
+        assert result == SUCCEEDED_PAYLOAD
+
+def test_next_poll_delay_backs_off_and_caps():
+    """
+    Without a Retry-After header the delay grows exponentially
+    and never exceeds POLL_MAX_DELAY.
+    """
+    delays = [ei._next_poll_delay(attempt, {}) for attempt in range(10)]
+
+    assert delays[0] == ei.POLL_INITIAL_DELAY
+    assert delays == sorted(delays)
+    assert max(delays) == ei.POLL_MAX_DELAY
+
+def test_next_poll_delay_honors_retry_after():
+    """
+    A numeric Retry-After header from Azure DI overrides our own backoff.
+    """
+    assert ei._next_poll_delay(0, {"Retry-After": "3"}) == 3.0
+    # Non-numeric (HTTP-date) values fall back to the computed delay
+    assert ei._next_poll_delay(0, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == ei.POLL_INITIAL_DELAY
+
+def test_next_poll_delay_clamps_retry_after():
+    """
+    Retry-After of "0" or below never causes a hot poll, and no wait
+    (Retry-After or our own backoff) runs past the remaining max_wait.
+    """
+    assert ei._next_poll_delay(0, {"Retry-After": "0"}) == ei.POLL_INITIAL_DELAY
+    assert ei._next_poll_delay(0, {"Retry-After": "-5"}) == ei.POLL_INITIAL_DELAY
+    assert ei._next_poll_delay(0, {"Retry-After": "120"}, remaining=4.5) == 4.5
+    assert ei._next_poll_delay(9, {}, rate_limited=True, remaining=0.1) == 0.1
+    assert ei._next_poll_delay(0, {}, remaining=-1.0) == 0.0
+
+@responses.activate
+def test_extract_invoice_large_retry_after_does_not_overshoot_max_wait():
+    """
+    A poll answering Retry-After: 120 with 10s of max_wait left sleeps
+    only those 10s, then times out.
+    """
+    _add_analyze()
+    responses.add(responses.GET, OP_URL, body=RUNNING_BODY, headers={"Retry-After": "120"})
+    sleeps = []
+    fake_clock = iter([0.0, 50.0, 61.0]).__next__
+
+    with pytest.raises(TimeoutError):
+        ei.extract_invoice(PDF_BYTES, clock=fake_clock, sleep=sleeps.append, max_wait=60)
 
-        # Header checks
-        assert headers["Ocp-Apim-Subscription-Key"] == "fake-key"
-        assert headers["Content-Type"] == "application/pdf"
+    assert sleeps == [10.0]
 
-        # Body check
-        assert data == b"dummy-pdf"
+def test_extract_invoice_async_success(monkeypatch):
+    """
+    The async extractor submits the PDF and polls through the shared
+    httpx.AsyncClient; a MockTransport stands in for Azure DI.
+    """
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["Ocp-Apim-Subscription-Key"] == "fake-key"
 
-        # Simulate Azure returning 202 + operation URL
-        return FakePostResponse(
-            status_code=202,
-            headers={"Operation-Location": "https://fake-op-url"},
-            text="",
+        if request.method == "POST":
+            assert "prebuilt-invoice:analyze" in str(request.url)
+            assert request.content == b"dummy-pdf"
+            return httpx.Response(202, headers={"Operation-Location": "https://fake-op-url"})
+
+        assert str(request.url) == "https://fake-op-url"
+        return httpx.Response(
+            200, json={"status": "succeeded", "analyzeResult": {"documents": []}}
         )
-    
-    # 3) Define fake GET to simulate polling reaching 'succeeded'
-    def fake_get(url, headers):
-        # Ensure the correct URL and headers are used
-        assert url == "https://fake-op-url"
-        assert headers["Ocp-Apim-Subscription-Key"] == "fake-key"
-
-        # This is what Azure would return on success
-        payload = {
-            "status": "succeeded",
-            "analyzeResult": {
-                "documents": [],
-            },
-        }
-        return FakeGetResponse(payload)
-    
-    # 4) Apply monkeypatches so extract_invoice() uses our fakes
-    monkeypatch.setattr(ei.requests, "post", fake_post, raising=True)
-    monkeypatch.setattr(ei.requests, "get", fake_get, raising=True)
-
-    # 5) Call the function under test with fake PDF bytes
-    result = ei.extract_invoice(b"dummy-pdf")
-
-    # 6) Validate the result
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr(ei, "_async_client", client)
+            return await ei.extract_invoice_async(io.BytesIO(b"dummy-pdf"))
+
+    result = asyncio.run(run())
+
     assert result["status"] == "succeeded"
-    assert "analyzeResult" in result
     assert "documents" in result["analyzeResult"]
 
-def test_extract_invoice_non_202_raises(monkeypatch):
+def test_extract_invoices_async_polls_all_operations(monkeypatch):
     """
-    Scenario:
-    - POST returns a non-202 status code (e.g. 400 Bad Request).
-    Expectation:
-    - extract_invoice() raises RuntimeError.
+    A batch submits every PDF, polls the operations together, and reports
+    per-document failures in place instead of failing the whole batch.
     """
+    async def no_sleep(_delay):
+        pass
+
+    polls = {"https://fake-op/good": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            if request.content == b"bad-pdf":
+                return httpx.Response(400, text="Bad request")
+            return httpx.Response(202, headers={"Operation-Location": "https://fake-op/good"})
+
+        # Report "running" once, then "succeeded"
+        polls["https://fake-op/good"] += 1
+        if polls["https://fake-op/good"] == 1:
+            return httpx.Response(200, json={"status": "running"})
+        return httpx.Response(
+            200, json={"status": "succeeded", "analyzeResult": {"documents": []}}
+        )
 
-    monkeypatch.setenv(
-        "DOCINT_ENDPOINT",
-        "https://fake-resource.cognitiveservices.azure.com",
-    )
-    monkeypatch.setenv("DOCINT_KEY", "fake-key")
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr(ei, "_async_client", client)
+            return await ei.extract_invoices_async([b"good-pdf", b"bad-pdf"], sleep=no_sleep)
 
-    def fake_post(url, headers, data):
-        return FakePostResponse(
-            status_code=400,
-            headers={},
-            text="Bad request",
+    good, bad = asyncio.run(run())
+
+    assert good["status"] == "succeeded"
+    assert isinstance(bad, RuntimeError)
+    assert "Azure DI error: 400" in str(bad)
+    assert polls["https://fake-op/good"] == 2
+
+def test_extract_invoice_async_retries_transient_statuses(monkeypatch):
+    """
+    A 503 on submit is retried (re-sending the rewound file body)
+    before the document is accepted.
+    """
+    monkeypatch.setattr(ei, "RETRY_BACKOFF_FACTOR", 0)
+
+    posted = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            posted.append(request.content)
+            if len(posted) == 1:
+                return httpx.Response(503, text="Service unavailable")
+            return httpx.Response(202, headers={"Operation-Location": "https://fake-op-url"})
+
+        return httpx.Response(
+            200, json={"status": "succeeded", "analyzeResult": {"documents": []}}
         )
 
-    monkeypatch.setattr(ei.requests, "post", fake_post, raising=True)
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr(ei, "_async_client", client)
+            return await ei.extract_invoice_async(io.BytesIO(b"dummy-pdf"))
 
-    with pytest.raises(RuntimeError) as excinfo:
-        ei.extract_invoice(b"dummy-pdf")
+    result = asyncio.run(run())
 
-    msg = str(excinfo.value)
-    assert "Azure DI error: 400" in msg
-    assert "Bad request" in msg
+    assert result["status"] == "succeeded"
+    assert posted == [b"dummy-pdf", b"dummy-pdf"]
 
-def test_extract_invoice_timeout(monkeypatch):
+def test_extract_invoice_async_caps_retry_after_on_5xx(monkeypatch):
     """
-    Scenario:
-    - Azure keeps returning status='running' (never finishes).
-    - We reduce MAX_WAIT_SECONDS so we don't wait a real minute.
-    - We fake time.time() so elapsed > MAX_WAIT_SECONDS after a few loops.
-    Expectation:
-    - extract_invoice() raises TimeoutError.
+    A 503 asking for Retry-After: 3600 is retried after at most
+    RETRY_AFTER_MAX seconds, for single and batch extraction alike.
     """
-    # 1) Set fake env vars so the function doesn't fail on config
-    monkeypatch.setenv(
-        "DOCINT_ENDPOINT",
-        "https://fake-resource.cognitiveservices.azure.com",
-    )
-    monkeypatch.setenv("DOCINT_KEY", "fake-key")
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503, headers={"Retry-After": "3600"}, text="Busy")
 
-    # 2) Shrink the timeout to 1 second for the test
-    monkeypatch.setattr(ei, "MAX_WAIT_SECONDS", 1, raising=True)
-    
-    # 3) Fake POST: Azure accepts the document and gives us an operation URL
-    def fake_post(url, headers, data):
-        return FakePostResponse(
-            status_code=202,
-            headers={"Operation-Location": "https://fake-op-url"},
-            text="",
-        )
+    sleeps = []
 
-    # 4) Fake GET: Azure always says "running" (never "succeeded" or "failed")
-    def fake_get(url, headers):
-        payload = {
-            "status": "running"
-        }
-        return FakeGetResponse(payload)
-    
-    # 5) Fake time: simulate time moving from 0 → 2 seconds
-    class FakeTime:
-        def __init__(self):
-            self.calls = 0
-
-        def time(self):
-            self.calls += 1
-            if self.calls == 1:
-                return 0.0         # start_time
-            elif self.calls == 2:
-                return 0.5         # elapsed = 0.5 (no timeout yet)
-            else:
-                return 2.0         # elapsed = 2.0 > 1 → timeout
-    
-    fake_time = FakeTime()
-
-    # Patch the time module used inside extract_invoice.py
-    monkeypatch.setattr(ei.time, "time", fake_time.time, raising=True)
-
-    # 6) Make sleep a no-op so the test is instant
-    monkeypatch.setattr(ei.time, "sleep", lambda s: None, raising=True)
-
-    # 7) Apply HTTP monkeypatches
-    monkeypatch.setattr(ei.requests, "post", fake_post, raising=True)
-    monkeypatch.setattr(ei.requests, "get", fake_get, raising=True)
-
-    # 8) Call the function and expect a TimeoutError
-    with pytest.raises(TimeoutError) as excinfo:
-        ei.extract_invoice(b"dummy-pdf")
-
-    msg = str(excinfo.value)
-    assert "timeout" in msg.lower()
-
-def test_extract_invoice_failed_status_raises(monkeypatch):
-    """
-    Scenario:
-    - POST returns 202 + operation URL (normal).
-    - GET to Operation-Location returns status='failed'.
-    Expectation:
-    - extract_invoice() raises RuntimeError indicating failure.
+    async def record_sleep(delay):
+        sleeps.append(delay)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr(ei, "_async_client", client)
+            with pytest.raises(RuntimeError, match="Azure DI error: 503"):
+                await ei.extract_invoice_async(b"x", sleep=record_sleep, max_wait=5)
+            return await ei.extract_invoices_async([b"x"], sleep=record_sleep, max_wait=5)
+
+    (batch_result,) = asyncio.run(run())
+
+    assert isinstance(batch_result, RuntimeError)
+    assert sleeps == [float(ei.RETRY_AFTER_MAX)] * (2 * ei.MAX_RETRIES)
+
+@responses.activate
+def test_extract_invoice_429_on_submit_raises_rate_limited():
+    """
+    A 429 on the analyze POST fails fast with RateLimitedError,
+    keeping Azure's Retry-After for the caller.
     """
+    _add_analyze(429, headers={"Retry-After": "7"})
 
-    monkeypatch.setenv(
-        "DOCINT_ENDPOINT",
-        "https://fake-resource.cognitiveservices.azure.com",
-    )
-    monkeypatch.setenv("DOCINT_KEY", "fake-key")
+    with pytest.raises(ei.RateLimitedError) as excinfo:
+        ei.extract_invoice(PDF_BYTES)
 
-    # Fake POST: normal acceptance
-    def fake_post(url, headers, data):
-        return FakePostResponse(
-            status_code=202,
-            headers={"Operation-Location": "https://fake-op-url"},
-            text="",
-        )
+    assert excinfo.value.retry_after == "7"
+
+@responses.activate
+def test_extract_invoice_429_while_polling_waits_and_continues():
+    """
+    A 429 during polling is not an error: we wait (Retry-After, or at
+    least RATE_LIMIT_DELAY) and poll again.
+    """
+    _add_analyze()
+    # Registered responses for the same URL are served in order
+    responses.add(responses.GET, OP_URL, status=429, json={"error": {"code": "429"}})
+    responses.add(responses.GET, OP_URL, body=SUCCEEDED_BODY)
+    sleeps = []
+
+    result = ei.extract_invoice(PDF_BYTES, sleep=sleeps.append)
+
+    assert result["status"] == "succeeded"
+    assert sleeps == [ei.RATE_LIMIT_DELAY]
+    assert len(responses.calls) == 3
+
+@responses.activate
+def test_session_does_not_retry_429_with_retry_after(monkeypatch):
+    """
+    Through the real adapter: urllib3 must not retry (or sleep on) a 429
+    carrying Retry-After; the submit fails fast after a single POST.
+    """
+    sleeps = []
+    monkeypatch.setattr(ei.time, "sleep", sleeps.append)
+    _add_analyze(429, headers={"Retry-After": "7"})
+
+    with pytest.raises(ei.RateLimitedError):
+        ei.extract_invoice(PDF_BYTES)
 
-    # Fake GET: Azure says "failed"
-    def fake_get(url, headers):
-        payload = {
-            "status": "failed",
-            "error": {"code": "SomeError", "message": "Processing failed"},
-        }
-        return FakeGetResponse(payload)
+    assert len(responses.calls) == 1
+    assert sleeps == []
+
+@responses.activate
+def test_session_retries_503_honoring_retry_after():
+    """
+    Transient 5xx are still retried, and (like _send_async() on the async
+    path) the retry waits for Retry-After when Azure sends one.
+    """
+    _add_analyze(503, headers={"Retry-After": "3"})
+    _add_analyze()
+    responses.add(responses.GET, OP_URL, body=SUCCEEDED_BODY)
 
-    monkeypatch.setattr(ei.requests, "post", fake_post, raising=True)
-    monkeypatch.setattr(ei.requests, "get", fake_get, raising=True)
+    result = ei.extract_invoice(PDF_BYTES)
+
+    assert result == SUCCEEDED_PAYLOAD
+    assert [call.request.method for call in responses.calls] == ["POST", "POST", "GET"]
+
+    # responses replays retries without sleeping, so check the policy itself
+    policy = ei._SESSION.get_adapter(OP_URL).max_retries
+    assert policy.respect_retry_after_header
+    assert policy.is_retry("POST", 503, has_retry_after=True)
+    assert not policy.is_retry("POST", 429, has_retry_after=True)
+
+def test_session_caps_retry_after_on_5xx(monkeypatch):
+    """
+    urllib3 sleeps for Retry-After before a 5xx retry; the sync policy caps
+    it at RETRY_AFTER_MAX like the async path, instead of urllib3's 6 hours.
+    """
+    sleeps = []
+    monkeypatch.setattr(ei.time, "sleep", sleeps.append)
+    response = SimpleNamespace(headers={"Retry-After": "3600"})
 
-    with pytest.raises(RuntimeError) as excinfo:
-        ei.extract_invoice(b"dummy-pdf")
+    policy = ei._SESSION.get_adapter(OP_URL).max_retries
 
-    msg = str(excinfo.value)
-    # Adjust string check to how you implemented the error message
-    assert "failed to process" in msg.lower() or "failed" in msg.lower()
\ No newline at end of file
+    assert policy.sleep_for_retry(response)
+    assert sleeps == [ei.RETRY_AFTER_MAX]
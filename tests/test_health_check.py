@@ -0,0 +1,96 @@
+# tests/test_health_check.py
+
+from types import SimpleNamespace
+
+import azure.functions as func
+import orjson
+import pytest
+import responses
+
+import functions.health_check as health
+
+ENDPOINT = "https://fake-resource.cognitiveservices.azure.com"
+
+@pytest.fixture(autouse=True)
+def _docint_env(monkeypatch):
+    """Fake Azure DI configuration and a fresh health-check state per test."""
+    monkeypatch.setenv("DOCINT_ENDPOINT", ENDPOINT)
+    monkeypatch.setenv("DOCINT_KEY", "fake-key")
+    monkeypatch.setattr(health, "_last_di_check", {"ts": 0.0, "result": None})
+    health._info_request.cache_clear()
+    yield
+    health._info_request.cache_clear()
+
+@responses.activate
+def test_document_intelligence_probe_is_not_retried():
+    """
+    The probe doesn't use the extraction retry policy: a 503 from /info
+    is reported after a single GET.
+    """
+    responses.add(responses.GET, f"{ENDPOINT}/formrecognizer/info", status=503, body="busy")
+
+    result = health._check_document_intelligence_uncached()
+
+    assert result["status"] == "error"
+    assert result["details"]["status_code"] == 503
+    assert len(responses.calls) == 1
+
+@responses.activate
+def test_missing_config_is_not_cached(monkeypatch):
+    """
+    A probe without DOCINT_* reports the missing settings, but once they are
+    set the next probe uses them (the error is not cached for the worker).
+    """
+    monkeypatch.delenv("DOCINT_KEY")
+
+    result = health._check_document_intelligence_uncached()
+
+    assert result["status"] == "error"
+    assert result["details"] == "Missing DOCINT_ENDPOINT or DOCINT_KEY"
+
+    monkeypatch.setenv("DOCINT_KEY", "fake-key")
+    responses.add(responses.GET, f"{ENDPOINT}/formrecognizer/info", json={})
+
+    assert health._check_document_intelligence_uncached()["status"] == "ok"
+
+def test_document_intelligence_result_is_cached_for_ttl(monkeypatch):
+    """
+    Probes within DI_CHECK_TTL_SECONDS reuse the last result; once it
+    expires, the next probe checks Azure DI again.
+    """
+    now = {"value": 100.0}
+    checks = []
+
+    def fake_uncached():
+        checks.append(now["value"])
+        return {"name": "document_intelligence", "status": "ok", "details": {}}
+
+    monkeypatch.setattr(health, "time", SimpleNamespace(monotonic=lambda: now["value"]))
+    monkeypatch.setattr(health, "_check_document_intelligence_uncached", fake_uncached)
+
+    first = health.check_document_intelligence()
+
+    now["value"] += health.DI_CHECK_TTL_SECONDS - 1
+    assert health.check_document_intelligence() is first
+    assert len(checks) == 1
+
+    now["value"] += 2   # now past the TTL
+    health.check_document_intelligence()
+    assert len(checks) == 2
+
+@responses.activate
+def test_main_is_compact_unless_pretty_requested():
+    """
+    The health payload is compact JSON by default and indented with ?pretty=1.
+    """
+    responses.add(responses.GET, f"{ENDPOINT}/formrecognizer/info", json={})
+
+    compact = health.main(func.HttpRequest(method="GET", url="/api/health", body=b""))
+    pretty = health.main(
+        func.HttpRequest(method="GET", url="/api/health", params={"pretty": "1"}, body=b"")
+    )
+
+    assert compact.status_code == pretty.status_code == 200
+    assert b"\n" not in compact.get_body()
+    assert pretty.get_body().startswith(b'{\n  "status": "ok"')
+    assert orjson.loads(pretty.get_body())["checks"] == orjson.loads(compact.get_body())["checks"]
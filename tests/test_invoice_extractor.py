@@ -0,0 +1,53 @@
+# tests/test_invoice_extractor.py
+
+import azure.functions as func
+import orjson
+
+import functions.invoice_extractor as extractor
+from src.extraction.extract_invoice import RateLimitedError
+
+def _pdf_request(params=None) -> func.HttpRequest:
+    return func.HttpRequest(
+        method="POST",
+        url="/api/invoice-extractor",
+        headers={"Content-Type": "application/pdf"},
+        params=params or {},
+        body=b"%PDF-1.4 content",
+    )
+
+def test_main_maps_rate_limit_and_timeout(monkeypatch):
+    """
+    A rate-limited submit becomes 429 with Azure's Retry-After passed
+    through; an Azure DI timeout becomes 504.
+    """
+    def rate_limited(pdf_bytes):
+        raise RateLimitedError("Azure DI rate limit reached (429).", retry_after="7")
+
+    monkeypatch.setattr(extractor, "process_invoice_bytes", rate_limited)
+    response = extractor.main(_pdf_request())
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+
+    def timed_out(pdf_bytes):
+        raise TimeoutError("Azure Document Intelligence timeout (60s)")
+
+    monkeypatch.setattr(extractor, "process_invoice_bytes", timed_out)
+    response = extractor.main(_pdf_request())
+
+    assert response.status_code == 504
+    assert "Retry-After" not in response.headers
+
+def test_main_is_compact_unless_pretty_requested(monkeypatch):
+    """
+    The normalized invoice is compact JSON by default and indented with ?pretty=1.
+    """
+    normalized = {"invoice_id": "INV-123", "items": [{"description": "Consulting"}]}
+    monkeypatch.setattr(extractor, "process_invoice_bytes", lambda pdf_bytes: normalized)
+
+    compact = extractor.main(_pdf_request()).get_body()
+    pretty = extractor.main(_pdf_request({"pretty": "1"})).get_body()
+
+    assert compact == orjson.dumps(normalized)
+    assert pretty == orjson.dumps(normalized, option=orjson.OPT_INDENT_2)
+    assert b"\n" in pretty
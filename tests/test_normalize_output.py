@@ -1,31 +1,25 @@
-import json
-from pathlib import Path
+from src.extraction.normalize_output import get_value, normalize_invoice
+from tests._helpers import assert_json_equal
 
-from src.extraction.normalize_output import normalize_invoice
-
-def load_json(path: Path):
-    """Small helper to read JSON from a file."""
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def test_normalize_matches_example():
+def test_normalize_matches_example(raw_sample, expected_normalized):
     """
     Given a sample raw Azure DI output (from samples/raw_output_example.json),
     normalize_invoice() should produce exactly the normalized JSON
     we saved in samples/normalized_output_example.json.
     """
-    # Find project root (one level up from this tests/ folder)
-    root = Path(__file__).resolve().parents[1]
-
-    raw_path = root / "samples" / "raw_output_example.json"
-    expected_path = root / "samples" / "normalized_output_example.json"
-
-    raw = load_json(raw_path)
-    expected = load_json(expected_path)
-
-    # Call your normalization logic
-    normalized = normalize_invoice(raw)
+    # Call your normalization logic (samples come from session fixtures)
+    normalized = normalize_invoice(raw_sample)
 
     # Check that the result matches what we expect
-    assert normalized == expected
\ No newline at end of file
+    assert_json_equal(normalized, expected_normalized)
+
+def test_get_value_reads_known_value_keys():
+    """
+    get_value() returns the first known value key a field carries (the
+    currency amount for valueCurrency). Falsy values are kept.
+    """
+    assert get_value({"type": "currency", "valueCurrency": {"amount": 0.0}}) == 0.0
+    assert get_value({"type": "number", "valueNumber": 0}) == 0
+    assert get_value({"valueDate": "2019-11-15"}) == "2019-11-15"
+    assert get_value({"type": "address", "valueAddress": {"city": "Redmond"}}) is None
+    assert get_value(None) is None
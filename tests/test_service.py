@@ -1,17 +1,15 @@
 # tests/test_service.py
 
-import json
-from pathlib import Path
+import asyncio
+import io
 
 import pytest
 
 from src.extraction import service
+from src.extraction.cache import DbmCache, cache_key
+from tests._helpers import assert_json_equal
 
-def load_json(path: Path):
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
-
-def test_process_invoice_bytes_happy_path(monkeypatch):
+def test_process_invoice_bytes_happy_path(raw_sample, expected_normalized, monkeypatch):
     """
     Goal of this test:
     - We pass some fake PDF bytes to process_invoice_bytes().
@@ -20,16 +18,9 @@ def test_process_invoice_bytes_happy_path(monkeypatch):
     - Then process_invoice_bytes should normalize it and return the final dict.
     - We assert the final dict matches our expected normalized JSON.
     """
-    # 1) Load sample raw + expected normalized JSON from your samples folder.
-    root = Path(__file__).resolve().parents[1]
-    raw_path = root / "samples" / "raw_output_example.json"
-    normalized_path = root / "samples" / "normalized_output_example.json"
-
-    with raw_path.open("r", encoding="utf-8") as f:
-        raw_sample = json.load(f)
-
-    with normalized_path.open("r", encoding="utf-8") as f:
-        expected_normalized = json.load(f)
+    # 1) Sample raw + expected normalized JSON come from the session-scoped
+    #    fixtures in conftest.py (normalize_invoice doesn't mutate its input,
+    #    so sharing them is safe).
 
     # 2) Define a fake extract_invoice function to replace the real Azure call.
     def fake_extract_invoice(pdf_bytes: bytes):
@@ -40,19 +31,133 @@ def test_process_invoice_bytes_happy_path(monkeypatch):
     
     # 3) Monkeypatch service.extract_invoice so inside service.process_invoice_bytes,
     #    the name "extract_invoice" actually refers to fake_extract_invoice.
-    monkeypatch.setattr(
-        service, "extract_invoice", fake_extract_invoice, raising=True
-    )
+    monkeypatch.setattr(service, "extract_invoice", fake_extract_invoice)
 
     # 4) Call the function under test with some fake bytes.
     result = service.process_invoice_bytes(b"fake-pdf-data")
 
     # 5) The result should equal the normalized JSON we expect.
-    assert result == expected_normalized
+    assert_json_equal(result, expected_normalized)
 
 def test_process_invoice_bytes_empty_raises():
     """
     Empty PDF bytes should cause process_invoice_bytes to raise ValueError.
     """
     with pytest.raises(ValueError):
-        service.process_invoice_bytes(b"")
\ No newline at end of file
+        service.process_invoice_bytes(b"")
+
+def test_process_invoice_bytes_cached_skips_azure_on_hit(monkeypatch, tmp_path):
+    """
+    With a cache configured, the second call for the same PDF bytes
+    is served from the cache and never reaches extract_invoice().
+    """
+    calls = []
+
+    def fake_extract_invoice(pdf_bytes: bytes):
+        calls.append(pdf_bytes)
+        return {"analyzeResult": {"documents": [{"fields": {}, "confidence": 0.9}]}}
+
+    cache = DbmCache(str(tmp_path / "invoice-cache"))
+    monkeypatch.setattr(service, "get_cache", lambda: cache)
+    monkeypatch.setattr(service, "extract_invoice", fake_extract_invoice)
+
+    first, first_hit = service.process_invoice_bytes_cached(b"fake-pdf-data")
+    second, second_hit = service.process_invoice_bytes_cached(b"fake-pdf-data")
+
+    assert (first_hit, second_hit) == (False, True)
+    assert first == second
+    assert len(calls) == 1
+
+def test_process_invoice_bytes_cached_falls_back_when_cache_fails(monkeypatch):
+    """
+    A broken cache (e.g. Redis down) is treated as a miss: the invoice is
+    still extracted from Azure DI instead of the request failing.
+    """
+    class BrokenCache:
+        def get(self, key):
+            raise ConnectionError("cache unavailable")
+
+        def put(self, key, normalized):
+            raise ConnectionError("cache unavailable")
+
+    def fake_extract_invoice(pdf_bytes: bytes):
+        return {"analyzeResult": {"documents": [{"fields": {}, "confidence": 0.9}]}}
+
+    monkeypatch.setattr(service, "get_cache", lambda: BrokenCache())
+    monkeypatch.setattr(service, "extract_invoice", fake_extract_invoice)
+
+    normalized, cache_hit = service.process_invoice_bytes_cached(b"fake-pdf-data")
+
+    assert cache_hit is False
+    assert normalized["confidence"] == 0.9
+
+def test_process_invoice_bytes_accepts_file_objects(monkeypatch):
+    """
+    A file object is forwarded to extract_invoice() as-is (streamed),
+    and an empty one is rejected like empty bytes.
+    """
+    pdf_file = io.BytesIO(b"fake-pdf-data")
+
+    def fake_extract_invoice(pdf):
+        assert pdf is pdf_file
+        return {"analyzeResult": {"documents": [{"fields": {}, "confidence": 0.9}]}}
+
+    monkeypatch.setattr(service, "get_cache", lambda: None)
+    monkeypatch.setattr(service, "extract_invoice", fake_extract_invoice)
+
+    result = service.process_invoice_bytes(pdf_file)
+
+    assert result["confidence"] == 0.9
+
+    with pytest.raises(ValueError):
+        service.process_invoice_bytes(io.BytesIO(b""))
+
+def test_process_invoice_batch_only_extracts_cache_misses(monkeypatch, tmp_path):
+    """
+    Cached PDFs are answered from the cache; only the misses are sent
+    to extract_invoices_async(), and results keep the input order.
+    """
+    raw = {"analyzeResult": {"documents": [{"fields": {}, "confidence": 0.9}]}}
+    cache = DbmCache(str(tmp_path / "invoice-cache"))
+    cache.put(cache_key(b"cached-pdf"), {"invoice_id": "INV-CACHED"})
+
+    async def fake_extract_invoices_async(pdfs):
+        assert pdfs == [b"new-pdf"]
+        return [raw]
+
+    monkeypatch.setattr(service, "get_cache", lambda: cache)
+    monkeypatch.setattr(service, "extract_invoices_async", fake_extract_invoices_async)
+
+    results = asyncio.run(service.process_invoice_batch([b"cached-pdf", b"new-pdf"]))
+
+    assert results[0] == {"invoice_id": "INV-CACHED"}
+    assert results[1]["confidence"] == 0.9
+
+def test_process_invoice_bytes_cached_async_coalesces_identical_pdfs(monkeypatch):
+    """
+    Concurrent requests for the same PDF share one extraction; a different
+    PDF still gets its own.
+    """
+    raw = {"analyzeResult": {"documents": [{"fields": {}, "confidence": 0.9}]}}
+    calls = []
+
+    async def fake_extract_invoice_async(pdf_bytes):
+        calls.append(pdf_bytes)
+        await asyncio.sleep(0.01)  # stay in flight while the others arrive
+        return raw
+
+    monkeypatch.setattr(service, "get_cache", lambda: None)
+    monkeypatch.setattr(service, "extract_invoice_async", fake_extract_invoice_async)
+
+    async def run():
+        return await asyncio.gather(
+            service.process_invoice_bytes_cached_async(b"same-pdf"),
+            service.process_invoice_bytes_cached_async(b"same-pdf"),
+            service.process_invoice_bytes_cached_async(b"other-pdf"),
+        )
+
+    results = asyncio.run(run())
+
+    assert sorted(calls) == [b"other-pdf", b"same-pdf"]
+    assert all(normalized["confidence"] == 0.9 for normalized, _ in results)
+    assert service._INFLIGHT == {}
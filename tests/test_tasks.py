@@ -0,0 +1,26 @@
+# tests/test_tasks.py
+
+from types import SimpleNamespace
+
+from celery.signals import before_task_publish
+
+from src.extraction import tasks
+
+def test_publishing_a_job_marks_it_queued(monkeypatch):
+    """
+    Jobs are recorded as QUEUED in the result backend before they are
+    published, so the status endpoint can tell them from unknown ids.
+    """
+    stored = []
+
+    class FakeBackend:
+        def store_result(self, task_id, result, state):
+            stored.append((task_id, result, state))
+
+    monkeypatch.setattr(tasks, "celery_app", SimpleNamespace(backend=FakeBackend()))
+
+    before_task_publish.send(
+        sender=tasks.extract_task.name, headers={"id": "job-123"}, body=()
+    )
+
+    assert stored == [("job-123", None, tasks.QUEUED_STATE)]